@@ -0,0 +1,118 @@
+import json
+import re
+import sys
+
+# Only these card fields are kept in memory; everything else in MTGJSON is
+# skipped while decoding.
+CARD_RECORD_FIELDS = [
+    "name",
+    "manaCost",
+    "manaValue",
+    "convertedManaCost",
+    "colors",
+    "colorIdentity",
+    "types",
+    "supertypes",
+    "legalities",
+    "layout",
+    "uuid",
+]
+
+JSON_TYPES = {
+    "string": "str",
+    "integer": "int",
+    "number": "float",
+    "boolean": "bool",
+    "object": "Dict[str, Any]",
+}
+
+
+def snake_case(name):
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+def python_type(prop):
+    prop_type = prop.get("type")
+    if isinstance(prop_type, list):
+        prop_type = next((t for t in prop_type if t != "null"), None)
+    if prop_type == "array":
+        item_type = JSON_TYPES.get((prop.get("items") or {}).get("type"), "Any")
+        return f"List[{item_type}]"
+    if prop_type == "object" and prop.get("properties"):
+        return "Dict[str, str]"
+    return JSON_TYPES.get(prop_type, "Any")
+
+
+def generate(schema):
+    properties = schema["properties"]
+    fields = [
+        (key, snake_case(key), python_type(properties.get(key, {})))
+        for key in CARD_RECORD_FIELDS
+    ]
+    slots = "".join(f'        "{slot}",\n' for _, slot, _ in fields)
+    annotations = "".join(
+        f"    {slot}: Optional[{type_}]\n" for _, slot, type_ in fields
+    )
+    init_args = "".join(f"        {slot}=None,\n" for _, slot, _ in fields)
+    init_body = "".join(f"        self.{slot} = {slot}\n" for _, slot, _ in fields)
+    field_map = "".join(f'    "{key}": "{slot}",\n' for key, slot, _ in fields)
+    return f'''# Generated by gen_records.py, do not edit.
+from typing import Any, Dict, Iterator, List, Optional
+
+import msgpack
+
+
+class CardRecord:
+    __slots__ = (
+{slots}    )
+
+{annotations}
+    def __init__(
+        self,
+{init_args}    ):
+{init_body}
+    def __repr__(self):
+        return "CardRecord(%s)" % ", ".join(
+            "%s=%r" % (slot, getattr(self, slot)) for slot in self.__slots__
+        )
+
+
+# MTGJSON key -> CardRecord slot
+FIELDS = {{
+{field_map}}}
+
+
+def read_card_record(unpacker: msgpack.Unpacker) -> CardRecord:
+    record = CardRecord()
+    for _ in range(unpacker.read_map_header()):
+        slot = FIELDS.get(unpacker.unpack())
+        if slot is None:
+            unpacker.skip()
+        else:
+            setattr(record, slot, unpacker.unpack())
+    return record
+
+
+def read_all_printings(unpacker: msgpack.Unpacker) -> Iterator[CardRecord]:
+    """
+    Stream CardRecords out of a msgpack encoded AllPrintings document without
+    materializing the fields or sets data we do not keep.
+    """
+    for _ in range(unpacker.read_map_header()):
+        if unpacker.unpack() != "data":
+            unpacker.skip()
+            continue
+        for _ in range(unpacker.read_map_header()):
+            unpacker.skip()  # set code
+            for _ in range(unpacker.read_map_header()):
+                if unpacker.unpack() != "cards":
+                    unpacker.skip()
+                    continue
+                for _ in range(unpacker.read_array_header()):
+                    yield read_card_record(unpacker)
+'''
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1]) as f:
+        print(generate(json.load(f)), end="")
@@ -3,3 +3,4 @@
 FILE=/tmp/schema-$(date +%s)
 python gen_schema.py data/card.json > $FILE
 jsonschema-gentypes --json-schema=$FILE --python=card_type_gen.py
+python gen_records.py $FILE > card_record_gen.py
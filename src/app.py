@@ -1,6 +1,10 @@
-from flask import Flask
+from flask import Flask, jsonify, request
+import redis
+
+from card_index import CardIndex
 
 app = Flask(__name__)
+card_index = CardIndex(redis.Redis())
 
 
 @app.route("/")
@@ -8,5 +12,19 @@ async def root():
     return "hello"
 
 
+@app.route("/search")
+def search():
+    query = request.args.get("q", "")
+    decks, truncated = card_index.search(query)
+    return jsonify(
+        {
+            "query": query,
+            "decks": card_index.deck_paths(decks),
+            # a prefix matched too many names, decks may be missing
+            "truncated": truncated,
+        }
+    )
+
+
 # start scheduler to fetch json
 # start scheduler to fetch dropbox
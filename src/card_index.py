@@ -0,0 +1,138 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Set, Tuple
+
+import redis
+
+NAMES_KEY = "card_index/names"
+DECK_PATHS_KEY = "card_index/deck_paths"
+# cap on how many names a single prefix term may expand to
+MAX_PREFIX_EXPANSION = 1000
+
+
+def normalize_name(name: str) -> str:
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(name.lower().split())
+
+
+def card_key(normalized_name: str) -> str:
+    return f"card_index/card/{normalized_name}"
+
+
+def deck_key(deck_hash: str) -> str:
+    return f"card_index/deck/{deck_hash}"
+
+
+class CardIndex:
+    """
+    Card name -> deck content hash postings kept as Redis sets, plus a
+    lexicographically sorted set of normalized names for prefix lookups.
+    """
+
+    def __init__(self, r: redis.Redis):
+        self.r = r
+
+    def add_deck(self, deck_hash: str, card_names: Iterable[str]) -> None:
+        names = {normalize_name(name) for name in card_names}
+        self._remove_postings(deck_hash)
+        if not names:
+            return
+        pipe = self.r.pipeline()
+        for name in names:
+            pipe.sadd(card_key(name), deck_hash)
+        pipe.sadd(deck_key(deck_hash), *names)
+        pipe.zadd(NAMES_KEY, {name: 0 for name in names})
+        pipe.execute()
+
+    def is_empty(self) -> bool:
+        return not self.r.exists(NAMES_KEY)
+
+    def set_deck_path(self, deck_hash: str, path: str) -> None:
+        self.r.hset(DECK_PATHS_KEY, deck_hash, path)
+
+    def set_deck_paths(self, paths: Dict[str, str]) -> None:
+        if paths:
+            self.r.hset(DECK_PATHS_KEY, mapping=paths)
+
+    def remove_decks(self, deck_hashes: Iterable[str]) -> None:
+        for deck_hash in deck_hashes:
+            self._remove_postings(deck_hash)
+            self.r.hdel(DECK_PATHS_KEY, deck_hash)
+
+    def _remove_postings(self, deck_hash: str) -> None:
+        names = [name.decode("utf-8") for name in self.r.smembers(deck_key(deck_hash))]
+        if not names:
+            return
+        pipe = self.r.pipeline()
+        for name in names:
+            pipe.srem(card_key(name), deck_hash)
+            pipe.scard(card_key(name))
+        pipe.delete(deck_key(deck_hash))
+        counts = pipe.execute()[1:-1:2]
+        # drop names no deck uses anymore so prefix search stays tight
+        unused = [name for name, count in zip(names, counts) if not count]
+        if unused:
+            self.r.zrem(NAMES_KEY, *unused)
+
+    def expand(self, term: str) -> Tuple[List[str], bool]:
+        """
+        Returns the names term matches and whether a prefix term matched
+        more than MAX_PREFIX_EXPANSION names and was cut short.
+        """
+        term = term.strip()
+        if not term.endswith("*"):
+            return [normalize_name(term)], False
+        prefix = normalize_name(term[:-1]).encode("utf-8")
+        names = [
+            name.decode("utf-8")
+            for name in self.r.zrangebylex(
+                NAMES_KEY,
+                b"[" + prefix,
+                b"[" + prefix + b"\xff",
+                start=0,
+                num=MAX_PREFIX_EXPANSION + 1,
+            )
+        ]
+        return names[:MAX_PREFIX_EXPANSION], len(names) > MAX_PREFIX_EXPANSION
+
+    def search(self, query: str) -> Tuple[Set[str], bool]:
+        """
+        query is card names joined by AND / OR, AND binding tighter, e.g.
+        "Sol Ring AND Arcane Signet OR Lightning*". A trailing * matches
+        every indexed name with that prefix. Also returns whether any prefix
+        was truncated, in which case the matches may be incomplete.
+        """
+        result: Set[str] = set()
+        truncated = False
+        for clause in re.split(r"\s+OR\s+", query.strip()):
+            terms = [term for term in re.split(r"\s+AND\s+", clause) if term.strip()]
+            if not terms:
+                continue
+            term_names = []
+            for term in terms:
+                names, term_truncated = self.expand(term)
+                term_names.append(names)
+                truncated |= term_truncated
+            if not all(term_names):
+                # some term matches no card, so this clause matches no deck
+                continue
+            pipe = self.r.pipeline()
+            for names in term_names:
+                pipe.sunion(*(card_key(name) for name in names))
+            postings = [
+                {deck.decode("utf-8") for deck in members} for members in pipe.execute()
+            ]
+            result |= set.intersection(*postings)
+        return result, truncated
+
+    def deck_paths(self, deck_hashes: Iterable[str]) -> List[str]:
+        deck_hashes = list(deck_hashes)
+        if not deck_hashes:
+            return []
+        return sorted(
+            (path or deck_hash.encode("utf-8")).decode("utf-8")
+            for deck_hash, path in zip(
+                deck_hashes, self.r.hmget(DECK_PATHS_KEY, deck_hashes)
+            )
+        )
@@ -0,0 +1,109 @@
+# Generated by gen_records.py, do not edit.
+from typing import Any, Dict, Iterator, List, Optional
+
+import msgpack
+
+
+class CardRecord:
+    __slots__ = (
+        "name",
+        "mana_cost",
+        "mana_value",
+        "converted_mana_cost",
+        "colors",
+        "color_identity",
+        "types",
+        "supertypes",
+        "legalities",
+        "layout",
+        "uuid",
+    )
+
+    name: Optional[str]
+    mana_cost: Optional[str]
+    mana_value: Optional[int]
+    converted_mana_cost: Optional[int]
+    colors: Optional[List[str]]
+    color_identity: Optional[List[str]]
+    types: Optional[List[str]]
+    supertypes: Optional[List[Any]]
+    legalities: Optional[Dict[str, str]]
+    layout: Optional[str]
+    uuid: Optional[str]
+
+    def __init__(
+        self,
+        name=None,
+        mana_cost=None,
+        mana_value=None,
+        converted_mana_cost=None,
+        colors=None,
+        color_identity=None,
+        types=None,
+        supertypes=None,
+        legalities=None,
+        layout=None,
+        uuid=None,
+    ):
+        self.name = name
+        self.mana_cost = mana_cost
+        self.mana_value = mana_value
+        self.converted_mana_cost = converted_mana_cost
+        self.colors = colors
+        self.color_identity = color_identity
+        self.types = types
+        self.supertypes = supertypes
+        self.legalities = legalities
+        self.layout = layout
+        self.uuid = uuid
+
+    def __repr__(self):
+        return "CardRecord(%s)" % ", ".join(
+            "%s=%r" % (slot, getattr(self, slot)) for slot in self.__slots__
+        )
+
+
+# MTGJSON key -> CardRecord slot
+FIELDS = {
+    "name": "name",
+    "manaCost": "mana_cost",
+    "manaValue": "mana_value",
+    "convertedManaCost": "converted_mana_cost",
+    "colors": "colors",
+    "colorIdentity": "color_identity",
+    "types": "types",
+    "supertypes": "supertypes",
+    "legalities": "legalities",
+    "layout": "layout",
+    "uuid": "uuid",
+}
+
+
+def read_card_record(unpacker: msgpack.Unpacker) -> CardRecord:
+    record = CardRecord()
+    for _ in range(unpacker.read_map_header()):
+        slot = FIELDS.get(unpacker.unpack())
+        if slot is None:
+            unpacker.skip()
+        else:
+            setattr(record, slot, unpacker.unpack())
+    return record
+
+
+def read_all_printings(unpacker: msgpack.Unpacker) -> Iterator[CardRecord]:
+    """
+    Stream CardRecords out of a msgpack encoded AllPrintings document without
+    materializing the fields or sets data we do not keep.
+    """
+    for _ in range(unpacker.read_map_header()):
+        if unpacker.unpack() != "data":
+            unpacker.skip()
+            continue
+        for _ in range(unpacker.read_map_header()):
+            unpacker.skip()  # set code
+            for _ in range(unpacker.read_map_header()):
+                if unpacker.unpack() != "cards":
+                    unpacker.skip()
+                    continue
+                for _ in range(unpacker.read_array_header()):
+                    yield read_card_record(unpacker)
@@ -1,22 +1,114 @@
+import io
 import json
-from mtg_types import Card, AllPrintings
-from typing import List, Optional
+import re
+import string
+from mtg_types import CardRecord
+from typing import Dict, List, Optional, Tuple
 
 import redis
+import untangle
 from serializer import d
 
+TXT_LINE_RE = re.compile(r"(SB: *)?([0-9]*)?\s*([^\n\r(]+)(?: \(.*)?$")
+
 
 class Deck:
-    commander: Optional[str]
-    mainboard: List[Card]
-    sideboard: List[Card]
+    # more than one for partner / background pairs
+    commanders: List[str]
+    mainboard: List[CardRecord]
+    sideboard: List[CardRecord]
+
+    def __init__(
+        self,
+        commanders: Optional[List[str]] = None,
+        mainboard: Optional[List[CardRecord]] = None,
+        sideboard: Optional[List[CardRecord]] = None,
+    ):
+        self.commanders = commanders or []
+        self.mainboard = mainboard or []
+        self.sideboard = sideboard or []
+
+    def card_names(self) -> List[str]:
+        return sorted({card.name for card in self.mainboard + self.sideboard})
+
+
+def parse_cod(deck_contents: bytes) -> Tuple[List[str], List[str], List[str]]:
+    # a file object, never a str, which untangle would open as a path or
+    # fetch as a URL; expat also honors the XML encoding declaration this way
+    deck = untangle.parse(io.BytesIO(deck_contents))
+    main = []
+    side_board = []
+    for zone in deck.cockatrice_deck.zone:
+        for card in zone.card:
+            if zone["name"] == "tokens":
+                continue
+            elif zone["name"] == "side":
+                side_board += [card["name"]] * int(card["number"] or 0)
+            else:
+                main += [card["name"]] * int(card["number"] or 0)
+    return main, side_board, []
+
+
+def parse_txt(deck_contents: bytes) -> Tuple[List[str], List[str], List[str]]:
+    main = []
+    side_board = []
+    commanders = []
+    saw_sideboard = False
+    in_commander = False
+    for line in deck_contents.decode("utf-8", "replace").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line in ["Companion", "Deck", "Commander"]:
+            in_commander = line == "Commander"
+            continue
+        if "Sideboard" in line:
+            saw_sideboard = True
+            in_commander = False
+            continue
+
+        match = TXT_LINE_RE.match(line)
+        if not match:
+            continue
+        sb, number, card = match.groups()
+        card = card.strip()
+        if not set(card) & set(string.ascii_letters):
+            continue
+        to_add = [card] * int(number or 1)
+        if in_commander:
+            commanders.append(card)
+        if sb or saw_sideboard:
+            side_board += to_add
+        else:
+            main += to_add
+    return main, side_board, commanders
+
+
+def parse_deck_contents(
+    deck_contents: bytes,
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Card names only, no database needed, so it can run in a process pool.
+    """
+    if deck_contents.lstrip().startswith(b"<"):
+        return parse_cod(deck_contents)
+    return parse_txt(deck_contents)
 
 
 class DeckParser:
-    def __init__(self, all_printings: AllPrintings, r: redis.Redis):
-        self.all_printings = all_printings
+    def __init__(self, cards_by_name: Dict[str, CardRecord], r: redis.Redis):
+        self.cards_by_name = cards_by_name
         self.r = r
 
     def parse_deck(self, deck_contents: bytes) -> Deck:
-        print(deck_contents)
-        return Deck()
+        return self.resolve(*parse_deck_contents(deck_contents))
+
+    def resolve(
+        self, main: List[str], side_board: List[str], commanders: List[str]
+    ) -> Deck:
+        # cards missing from the database (typos, tokens) are dropped
+        return Deck(
+            commanders,
+            [self.cards_by_name[c] for c in main if c in self.cards_by_name],
+            [self.cards_by_name[c] for c in side_board if c in self.cards_by_name],
+        )
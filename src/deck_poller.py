@@ -1,24 +1,39 @@
 import asyncio
+import concurrent.futures
 import datetime
-import io
 import json
 import logging
 import lzma
-from typing import Iterable, List, Set, Tuple, Optional
+import os
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Set,
+    Tuple,
+    Optional,
+    Union,
+)
 
 import aiohttp
+import click
 import redis
 from dropbox.files import FileMetadata
 
 import constants
-from mtg_types import AllPrintings
-from serializer import s, d
+import download
+from card_index import CardIndex
+import card_record_gen
+from mtg_types import CardRecord
+from serializer import s, d, unpacker
+from work_queue import WorkQueue
 import dropbox_client
 
 # poll for new decks
 # if new card data, redo everything
 # build data for decks
-from deck_parser import DeckParser
+from deck_parser import DeckParser, parse_deck_contents
 
 ONE_HOUR_SEC = 60 * 60
 
@@ -27,16 +42,163 @@ logger = logging.getLogger(__name__)
 
 META_URL = "https://mtgjson.com/api/v5/Meta.json"
 ALL_PRINTINGS_URL = "https://mtgjson.com/api/v5/AllPrintings.json.xz"
+ALL_PRINTINGS_SHA256_URL = ALL_PRINTINGS_URL + ".sha256"
+MTG_JSON_DIR = "data/mtg_json"
+
+DECK_QUEUE = "decks"
+DOWNLOAD_CONCURRENCY = 16
+PARSE_CONCURRENCY = 8
+PIPELINE_QUEUE_SIZE = 64
+WORKER_IDLE_SLEEP_SEC = 1
+# saved decks not indexed yet, e.g. while card data failed to load; the
+# poller catches up on them
+UNINDEXED_DECKS_KEY = "unindexed_decks"
+
+CARD_VERSION_KEY = "mtg_json/version"
+CARD_REFRESH_LOCK = "mtg_json/refresh_lock"
+CARD_REFRESH_LEASE_SEC = 5 * 60
+CARD_REFRESH_RENEW_SEC = 60
+CARD_REFRESH_WAIT_SEC = 1
+CARD_OLD_VERSION_TTL_SEC = ONE_HOUR_SEC
+
+# deck hash and the (main, side board, commanders) card names in it
+ParsedDeck = Tuple[str, Tuple[List[str], List[str], List[str]]]
+
+
+def all_printings_key(version: Union[str, bytes]) -> str:
+    if isinstance(version, bytes):
+        version = version.decode("utf-8")
+    return f"mtg_json/all_printings/{version}"
+
+
+def load_xz_json(path: str):
+    with lzma.open(path) as f:
+        return json.load(f)
+
+
+def remove_card_spools() -> None:
+    # downloads and partial spools of versions that are already published or
+    # superseded
+    if not os.path.isdir(MTG_JSON_DIR):
+        return
+    for name in os.listdir(MTG_JSON_DIR):
+        if name.startswith("AllPrintings-"):
+            os.remove(os.path.join(MTG_JSON_DIR, name))
+
+
+def published_all_printings(
+    r: redis.Redis, version: Optional[bytes] = None
+) -> Optional[bytes]:
+    version = version or r.get(CARD_VERSION_KEY)
+    return r.get(all_printings_key(version)) if version else None
+
+
+def load_card_records(
+    r: redis.Redis, version: Optional[bytes] = None
+) -> Dict[str, CardRecord]:
+    # streamed, so the full MTGJSON dicts are never built
+    buf = published_all_printings(r, version)
+    if not buf:
+        return {}
+    cards_by_name: Dict[str, CardRecord] = {}
+    for record in card_record_gen.read_all_printings(unpacker(buf)):
+        cards_by_name.setdefault(record.name, record)
+    return cards_by_name
+
+
+class DeckParserCache:
+    """
+    Hands out a DeckParser for the given card data version, by default the
+    currently published one, rebuilding it only when the version changes.
+    """
+
+    def __init__(self, r: redis.Redis):
+        self.r = r
+        self.version: Optional[bytes] = None
+        self.deck_parser: Optional[DeckParser] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self, version: Optional[bytes] = None) -> Optional[DeckParser]:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            version = version or self.r.get(CARD_VERSION_KEY)
+            if version != self.version:
+                loop = asyncio.get_running_loop()
+                cards_by_name = await loop.run_in_executor(
+                    None, load_card_records, self.r, version
+                )
+                self.deck_parser = (
+                    DeckParser(cards_by_name, self.r) if cards_by_name else None
+                )
+                self.version = version
+            return self.deck_parser
 
 
 class DeckPoller:
-    def __init__(self):
-        self.dropbox_client = dropbox_client.DropboxDeckClient()
+    def __init__(self, use_queue: bool = False):
+        accounts = dropbox_client.load_accounts()
+        self.dropbox_clients = dropbox_client.async_clients(accounts)
+        self.deck_roots: List[Tuple[str, str]] = [
+            (name, root) for name, account in accounts.items() for root in account.roots
+        ]
         self.r = redis.Redis()
+        # when set, downloads are handed to DeckWorkers instead of done here
+        self.queue = WorkQueue(self.r, DECK_QUEUE) if use_queue else None
+        # version of the card data this process last loaded
+        self.card_version: Optional[bytes] = None
+        self.card_index = CardIndex(self.r)
+        self.process_pool = concurrent.futures.ProcessPoolExecutor()
+        self.deck_parsers = DeckParserCache(self.r)
+
+    async def refresh_cards(self, mtg_json_poll_interval_sec: int) -> bool:
+        """
+        Only the replica holding the refresh lease talks to MTGJSON; the rest
+        wait for it to finish and pick up whatever version it published.
+        Returns whether the card data changed since this process last loaded
+        it.
+        """
+        lock = self.r.lock(CARD_REFRESH_LOCK, timeout=CARD_REFRESH_LEASE_SEC)
+        if not lock.acquire(blocking=False):
+            logger.debug("Another replica is refreshing cards, waiting")
+            while self.r.exists(CARD_REFRESH_LOCK):
+                await asyncio.sleep(CARD_REFRESH_WAIT_SEC)
+            return self.load_published_cards()
+
+        # renewed for the whole refresh, decompressing and serializing the
+        # card data can take longer than the lease on its own
+        renewer = asyncio.create_task(self.renew_card_refresh_lease(lock))
+        try:
+            published = await self.refresh_cards_leader(
+                mtg_json_poll_interval_sec, lock
+            )
+        except redis.exceptions.LockNotOwnedError:
+            # another replica took over the refresh, use what it publishes
+            logger.warning("Lost the card refresh lease, not publishing")
+            published = False
+        finally:
+            renewer.cancel()
+            try:
+                lock.release()
+            except redis.exceptions.LockError:
+                logger.warning("Card refresh lease expired before release")
+        if not published:
+            return self.load_published_cards()
+        return True
 
-    async def refresh_cards(
-        self, mtg_json_poll_interval_sec: int
-    ) -> Tuple[Optional[AllPrintings], bool]:
+    async def renew_card_refresh_lease(self, lock: redis.lock.Lock) -> None:
+        while True:
+            await asyncio.sleep(CARD_REFRESH_RENEW_SEC)
+            try:
+                lock.reacquire()
+            except redis.exceptions.LockNotOwnedError:
+                # the leader finds out when it tries to publish
+                logger.warning("Card refresh lease expired before renewal")
+                return
+
+    async def refresh_cards_leader(
+        self, mtg_json_poll_interval_sec: int, lock: redis.lock.Lock
+    ) -> bool:
         last_meta_poll = datetime.datetime.fromisoformat(
             (self.r.get("last_meta_poll") or b"").decode("utf-8") or "1970-01-01"
         )
@@ -46,84 +208,308 @@ class DeckPoller:
             + datetime.timedelta(seconds=mtg_json_poll_interval_sec)
             > datetime.datetime.now()
         )
-        meta = d(self.r.get("mtg_json/meta"))
-        all_printings = d(self.r.get("mtg_json/all_printings"))
-        if not need_poll and meta and all_printings:
-            return all_printings, False
+        published_version = self.r.get(CARD_VERSION_KEY)
+        if not need_poll and published_version:
+            return False
 
         async with aiohttp.ClientSession() as session:
             async with session.get(META_URL) as resp:
                 meta_json = await resp.text()
 
         self.r["mtg_json/meta"] = s(meta_json)
-        self.r["last_meta_poll"] = datetime.datetime.now().isoformat()
-        meta_obj = json.loads(meta_json)
-        if all_printings and meta_obj:
-            all_printings_obj = json.load(all_printings)
-            if all_printings_obj["meta"]["date"] == meta_obj["meta"]["date"]:
-                return all_printings, False
+        version = json.loads(meta_json)["meta"]["date"]
+        if published_version and published_version.decode("utf-8") == version:
+            self.r["last_meta_poll"] = datetime.datetime.now().isoformat()
+            remove_card_spools()
+            return False
 
         logger.debug("Refreshing cards")
-        decompressor = lzma.LZMADecompressor()
-        buf = io.BytesIO()
+        # versioned so a half finished spool of an older release is never
+        # resumed into a newer one
+        xz_path = os.path.join(MTG_JSON_DIR, f"AllPrintings-{version}.json.xz")
+        os.makedirs(MTG_JSON_DIR, exist_ok=True)
         async with aiohttp.ClientSession() as session:
-            async with session.get(ALL_PRINTINGS_URL) as resp:
-                while resp_bytes := await resp.content.readany():
-                    buf.write(decompressor.decompress(resp_bytes))
-                buf.seek(0)
-        all_printings_bytes = buf.read()
-        all_printings = json.loads(all_printings_bytes)
-        self.r["mtg_json/all_printings"] = s(all_printings_bytes)
-        return all_printings, True
-
-    async def fetch_dropbox_metadata(self):
+            expected_sha256 = await download.fetch_sha256(
+                session, ALL_PRINTINGS_SHA256_URL
+            )
+            await download.download_resumable(
+                session, ALL_PRINTINGS_URL, xz_path, expected_sha256
+            )
         loop = asyncio.get_running_loop()
-        file_list = await loop.run_in_executor(None, self.dropbox_client.list_files)
+        all_printings = await loop.run_in_executor(None, load_xz_json, xz_path)
+
+        # raises if the lease was lost, in which case another replica owns
+        # the refresh and we must not publish over it
+        all_printings_bytes = await loop.run_in_executor(None, s, all_printings)
+        lock.reacquire()
+        pipe = self.r.pipeline()
+        # stored decoded so load_card_records can stream it
+        pipe.set(all_printings_key(version), all_printings_bytes)
+        pipe.set(CARD_VERSION_KEY, version)
+        # only stamped once published, so an interrupted download is resumed
+        # on the next poll instead of after the poll interval
+        pipe.set("last_meta_poll", datetime.datetime.now().isoformat())
+        if published_version:
+            # readers that just saw the old version can still fetch it
+            pipe.expire(all_printings_key(published_version), CARD_OLD_VERSION_TTL_SEC)
+        pipe.execute()
+        logger.info("Published card data version %s", version)
+        remove_card_spools()
+        self.card_version = version.encode("utf-8")
+        return True
+
+    def load_published_cards(self) -> bool:
+        version = self.r.get(CARD_VERSION_KEY)
+        if not version:
+            return False
+        updated = self.card_version is not None and version != self.card_version
+        self.card_version = version
+        return updated
+
+    async def close(self):
+        for client in self.dropbox_clients.values():
+            await client.close()
+        self.process_pool.shutdown()
+
+    async def fetch_dropbox_metadata(self) -> List[Tuple[str, FileMetadata]]:
+        file_lists = await asyncio.gather(
+            *(
+                self.dropbox_clients[account].list_files(root)
+                for account, root in self.deck_roots
+            )
+        )
 
         return [
-            file
+            (account, file)
+            for (account, _), file_list in zip(self.deck_roots, file_lists)
             for file in file_list
             if file.path_lower.endswith(constants.SUPPORTED_DECK_EXTENSIONS)
         ]
 
-    async def fetch_dropbox_decks(
-        self, deck_metadatas: Iterable[FileMetadata]
-    ) -> List[Tuple[FileMetadata, bytes]]:
+    async def download_decks(
+        self, to_fetch: asyncio.Queue, deck_bodies: asyncio.Queue
+    ) -> None:
+        while not to_fetch.empty():
+            account, metadata = to_fetch.get_nowait()
+            try:
+                metadata, deck_body = await self.dropbox_clients[account].fetch_deck(
+                    metadata
+                )
+            except Exception:
+                # not saved, so the next poll fetches it again
+                logger.exception("Could not download %s", metadata.path_display)
+                continue
+            logger.info("Saving %s %s", metadata.name, metadata.content_hash)
+            pipe = self.r.pipeline()
+            pipe.set(f"decks/{metadata.content_hash}", s(deck_body))
+            pipe.sadd(UNINDEXED_DECKS_KEY, metadata.content_hash)
+            pipe.execute()
+            self.card_index.set_deck_path(metadata.content_hash, metadata.path_display)
+            await deck_bodies.put((metadata.content_hash, deck_body))
+
+    async def read_saved_decks(
+        self, deck_bodies: asyncio.Queue, skip: Set[str]
+    ) -> None:
+        for path in self.r.scan_iter(match="decks/*"):
+            # strip the 6 character "decks/"
+            deck_hash = path[6:].decode("utf-8")
+            if deck_hash in skip:
+                continue
+            await deck_bodies.put((deck_hash, d(self.r.get(path))))
+
+    async def read_unindexed_decks(
+        self, deck_bodies: asyncio.Queue, skip: Set[str]
+    ) -> None:
+        for member in self.r.sscan_iter(UNINDEXED_DECKS_KEY):
+            deck_hash = member.decode("utf-8")
+            if deck_hash in skip:
+                continue
+            deck_body = d(self.r.get(f"decks/{deck_hash}"))
+            if deck_body is None:
+                # deleted since it was saved
+                self.r.srem(UNINDEXED_DECKS_KEY, deck_hash)
+                continue
+            await deck_bodies.put((deck_hash, deck_body))
+
+    async def deck_parser(self, card_task: asyncio.Task) -> Optional[DeckParser]:
+        """
+        Parser for the card data card_task loaded, or None if the refresh
+        failed or there is no card data yet.
+        """
+        try:
+            # shielded so a cancelled parse stage leaves the refresh running
+            await asyncio.shield(card_task)
+        except Exception:
+            # logged by poll_loop, decks are indexed on the next poll
+            return None
+        if self.card_version is None:
+            return None
+        return await self.deck_parsers.get(self.card_version)
+
+    async def index_decks(
+        self,
+        card_task: asyncio.Task,
+        parsed_decks: List[ParsedDeck],
+        indexed: Set[str],
+    ) -> None:
+        deck_parser = await self.deck_parser(card_task)
+        if deck_parser is None:
+            return
+        for deck_hash, parsed in parsed_decks:
+            deck = deck_parser.resolve(*parsed)
+            self.card_index.add_deck(deck_hash, deck.card_names())
+            indexed.add(deck_hash)
+        if parsed_decks:
+            self.r.srem(
+                UNINDEXED_DECKS_KEY, *(deck_hash for deck_hash, _ in parsed_decks)
+            )
+
+    async def parse_decks(
+        self,
+        deck_bodies: asyncio.Queue,
+        card_task: asyncio.Task,
+        waiting: List[ParsedDeck],
+        indexed: Set[str],
+    ) -> None:
         loop = asyncio.get_running_loop()
-        coros = [
-            loop.run_in_executor(None, self.dropbox_client.fetch_deck, metadata)
-            for metadata in deck_metadatas
-        ]
-        ret = [
-            (metadata, file_body)
-            for metadata, file_body in await asyncio.gather(*coros)
-        ]
-        return ret
+        while (item := await deck_bodies.get()) is not None:
+            deck_hash, deck_body = item
+            if card_task.done() and await self.deck_parser(card_task) is None:
+                # no card data, keep draining so downloads are not blocked
+                continue
+            try:
+                parsed = await loop.run_in_executor(
+                    self.process_pool, parse_deck_contents, deck_body
+                )
+            except Exception:
+                # retrying won't help until the deck itself changes
+                logger.exception("Could not parse deck %s", deck_hash)
+                self.r.srem(UNINDEXED_DECKS_KEY, deck_hash)
+                continue
+            if card_task.done():
+                await self.index_decks(card_task, [(deck_hash, parsed)], indexed)
+            else:
+                # only card names so far, resolved once the card data is in
+                waiting.append((deck_hash, parsed))
 
-    async def refresh_decks(self, to_fetch_decks: List[FileMetadata]) -> None:
-        logger.info("Decks needing refresh: %s", [d.name for d in to_fetch_decks])
-        deck_contents = await self.fetch_dropbox_decks(to_fetch_decks)
-        for metadata, deck_body in deck_contents:
-            logger.info("Saving %s %s", metadata.name, metadata.content_hash)
-            self.r[f"decks/{metadata.content_hash}"] = s(deck_body)
+    async def run_pipeline(
+        self,
+        produce: Callable[[asyncio.Queue], Awaitable[None]],
+        card_task: asyncio.Task,
+    ) -> Set[str]:
+        """
+        Feed (deck hash, deck body) pairs from produce through the parse
+        stage as they arrive. The queue between them is bounded so a slow
+        stage applies backpressure instead of buffering every deck. Parsing
+        does not wait on card_task, only resolving cards against the
+        database does. Returns the hashes of the decks indexed.
+        """
+        deck_bodies: asyncio.Queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        waiting: List[ParsedDeck] = []
+        indexed: Set[str] = set()
 
-    def recalculate_decks(self, all_printings: AllPrintings):
-        redis_deck_paths: Set[bytes] = set(self.r.scan_iter(match="decks/*"))
-        deck_parser = DeckParser(all_printings, self.r)
-        for path in redis_deck_paths:
-            deck = deck_parser.parse_deck(d(self.r.get(path)))
-            print(deck)
-            break
+        async def producer():
+            await produce(deck_bodies)
+            for _ in range(PARSE_CONCURRENCY):
+                await deck_bodies.put(None)
+
+        # a failing stage cancels the others instead of leaving them blocked
+        # on the queue
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(producer())
+            for _ in range(PARSE_CONCURRENCY):
+                tg.create_task(
+                    self.parse_decks(deck_bodies, card_task, waiting, indexed)
+                )
+        await self.index_decks(card_task, waiting, indexed)
+        return indexed
+
+    async def refresh_decks(
+        self,
+        to_fetch_decks: List[Tuple[str, FileMetadata]],
+        card_task: asyncio.Task,
+    ) -> Set[str]:
+        logger.info("Decks needing refresh: %s", [d.name for _, d in to_fetch_decks])
+        if self.queue is not None:
+            for account, metadata in to_fetch_decks:
+                self.queue.enqueue(
+                    metadata.content_hash,
+                    {"account": account, "path": metadata.path_display},
+                )
+            return set()
+
+        to_fetch: asyncio.Queue = asyncio.Queue()
+        for deck in to_fetch_decks:
+            to_fetch.put_nowait(deck)
+
+        async def download(deck_bodies: asyncio.Queue):
+            await asyncio.gather(
+                *(
+                    self.download_decks(to_fetch, deck_bodies)
+                    for _ in range(DOWNLOAD_CONCURRENCY)
+                )
+            )
+
+        return await self.run_pipeline(download, card_task)
+
+    async def recalculate_decks(
+        self, card_task: asyncio.Task, skip: Set[str]
+    ) -> Set[str]:
+        async def read_saved(deck_bodies: asyncio.Queue):
+            await self.read_saved_decks(deck_bodies, skip)
+
+        return await self.run_pipeline(read_saved, card_task)
+
+    async def index_unindexed_decks(
+        self, card_task: asyncio.Task, skip: Set[str]
+    ) -> Set[str]:
+        async def read_unindexed(deck_bodies: asyncio.Queue):
+            await self.read_unindexed_decks(deck_bodies, skip)
+
+        return await self.run_pipeline(read_unindexed, card_task)
 
     async def poll_loop(self, mtg_json_poll_interval_sec: int = ONE_HOUR_SEC):
-        card_database_updated_coro = self.refresh_cards(mtg_json_poll_interval_sec)
+        # runs alongside listing and downloading, parsing waits on it
+        card_task = asyncio.create_task(self.refresh_cards(mtg_json_poll_interval_sec))
+        try:
+            indexed = await self.refresh_dropbox_decks(card_task)
+        except BaseException:
+            card_task.cancel()
+            raise
+
+        # do a full refresh if the card database has updated
+        try:
+            all_needs_refresh = await card_task
+        except Exception:
+            # downloads are saved, they get indexed on the next poll
+            logger.exception("Could not refresh cards")
+            return
+        logger.info("All needs refresh: %s", all_needs_refresh)
+
+        if all_needs_refresh or self.card_index.is_empty():
+            # decks downloaded above were already resolved against the new
+            # card data
+            await self.recalculate_decks(card_task, indexed)
+        elif self.r.exists(UNINDEXED_DECKS_KEY):
+            # catch up on decks an earlier poll saved but could not index
+            await self.index_unindexed_decks(card_task, indexed)
 
+    async def refresh_dropbox_decks(self, card_task: asyncio.Task) -> Set[str]:
         deck_metadatas = await self.fetch_dropbox_metadata()
         dropbox_deck_paths: Set[bytes] = {
             f"decks/{metadata.content_hash}".encode("utf-8")
-            for metadata in deck_metadatas
+            for _, metadata in deck_metadatas
         }
 
+        # also covers decks saved before paths were tracked and decks that
+        # were moved or renamed without changing content
+        self.card_index.set_deck_paths(
+            {
+                metadata.content_hash: metadata.path_display
+                for _, metadata in deck_metadatas
+            }
+        )
+
         redis_deck_paths: Set[bytes] = set(self.r.scan_iter(match="decks/*"))
         logger.debug("Found existing decks: %d", len(redis_deck_paths))
         deleted_deck_paths = redis_deck_paths - dropbox_deck_paths
@@ -133,25 +519,98 @@ class DeckPoller:
         }
         if deleted_deck_paths:
             self.r.delete(*deleted_deck_paths)
+            self.r.srem(UNINDEXED_DECKS_KEY, *(path[6:] for path in deleted_deck_paths))
+            self.card_index.remove_decks(
+                path[6:].decode("utf-8") for path in deleted_deck_paths
+            )
 
         to_fetch_decks = [
-            file
-            for file in deck_metadatas
+            (account, file)
+            for account, file in deck_metadatas
             if file.content_hash.encode("utf-8") in to_fetch_deck_hashs
         ]
-        await self.refresh_decks(to_fetch_decks)
+        return await self.refresh_decks(to_fetch_decks, card_task)
+
+
+class DeckWorker:
+    """
+    Claims deck jobs queued by a DeckPoller running with use_queue, then
+    downloads, saves and parses them. Run as many as needed, on any host
+    that can reach the Redis instance.
+    """
+
+    def __init__(self):
+        self.dropbox_clients = dropbox_client.async_clients(
+            dropbox_client.load_accounts()
+        )
+        self.r = redis.Redis()
+        self.queue = WorkQueue(self.r, DECK_QUEUE)
+        self.card_index = CardIndex(self.r)
+        self.deck_parsers = DeckParserCache(self.r)
+        self.process_pool = concurrent.futures.ProcessPoolExecutor()
+
+    async def close(self):
+        for client in self.dropbox_clients.values():
+            await client.close()
+        self.process_pool.shutdown()
+
+    async def handle(self, job) -> None:
+        # the poller replaces the path in a queued job if the file moves
+        client = self.dropbox_clients[job["account"]]
+        metadata, deck_body = await client.fetch_path(job["path"])
+        logger.info("Saving %s %s", metadata.name, metadata.content_hash)
+        pipe = self.r.pipeline()
+        pipe.set(f"decks/{metadata.content_hash}", s(deck_body))
+        # the poller indexes it if this worker can't
+        pipe.sadd(UNINDEXED_DECKS_KEY, metadata.content_hash)
+        pipe.execute()
+        self.card_index.set_deck_path(metadata.content_hash, metadata.path_display)
+        deck_parser = await self.deck_parsers.get()
+        if deck_parser is None:
+            return
+        loop = asyncio.get_running_loop()
+        parsed = await loop.run_in_executor(
+            self.process_pool, parse_deck_contents, deck_body
+        )
+        deck = deck_parser.resolve(*parsed)
+        self.card_index.add_deck(metadata.content_hash, deck.card_names())
+        self.r.srem(UNINDEXED_DECKS_KEY, metadata.content_hash)
+
+    async def work_loop(self, concurrency: int = 8):
+        async def work():
+            while True:
+                claimed = self.queue.claim()
+                if claimed is None:
+                    await asyncio.sleep(WORKER_IDLE_SLEEP_SEC)
+                    continue
+                job_id, job = claimed
+                try:
+                    await self.handle(job)
+                except Exception:
+                    # left leased, so it is retried once the lease runs out
+                    logger.exception("Deck job %s failed", job_id)
+                    continue
+                self.queue.ack(job_id)
+
+        await asyncio.gather(*(work() for _ in range(concurrency)))
 
-        # do a full refresh if the card database has updated
-        all_printings, all_needs_refresh = await card_database_updated_coro
-        logger.info("All needs refresh: %s", all_needs_refresh)
 
-        if True or all_needs_refresh:
-            self.recalculate_decks(all_printings)
+async def run(worker: bool, use_queue: bool):
+    runner = DeckWorker() if worker else DeckPoller(use_queue)
+    try:
+        if worker:
+            await runner.work_loop()
+        else:
+            await runner.poll_loop()
+    finally:
+        await runner.close()
 
 
-def main():
-    poller = DeckPoller()
-    asyncio.run(poller.poll_loop())
+@click.command()
+@click.option("--worker", is_flag=True, help="Process queued deck jobs")
+@click.option("--queue", "use_queue", is_flag=True, help="Queue deck jobs for workers")
+def main(worker, use_queue):
+    asyncio.run(run(worker, use_queue))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import logging
+import os
+
+import aiohttp
+
+CHUNK_SIZE = 1024 * 1024
+MAX_ATTEMPTS = 8
+RETRY_BACKOFF_SEC = 2
+
+logger = logging.getLogger(__name__)
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+async def fetch_sha256(session: aiohttp.ClientSession, url: str) -> str:
+    # MTGJSON publishes <file>.sha256 holding just the hex digest
+    async with session.get(url) as resp:
+        resp.raise_for_status()
+        return (await resp.text()).split()[0].lower()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def download_resumable(
+    session: aiohttp.ClientSession,
+    url: str,
+    dest_path: str,
+    expected_sha256: str,
+) -> str:
+    """
+    Download url to dest_path, spooling into dest_path + ".part" and resuming
+    with a Range request when the connection drops. dest_path only appears
+    once the whole file matches expected_sha256.
+    """
+    loop = asyncio.get_running_loop()
+    if os.path.exists(dest_path):
+        # left by an earlier run that finished the download but did not use it
+        actual_sha256 = await loop.run_in_executor(None, file_sha256, dest_path)
+        if actual_sha256 == expected_sha256:
+            return dest_path
+
+    part_path = dest_path + ".part"
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            async with session.get(url, headers=headers) as resp:
+                if resp.status == 416:
+                    # nothing left past offset, the spool is already whole
+                    break
+                resp.raise_for_status()
+                if resp.status != 206:
+                    # server ignored the range, start over
+                    offset = 0
+                logger.debug("Downloading %s from byte %d", url, offset)
+                with open(part_path, "ab" if offset else "wb") as f:
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+            break
+        except (
+            aiohttp.ClientPayloadError,
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientResponseError,
+            asyncio.TimeoutError,
+        ) as e:
+            # server errors are as transient as a dropped connection
+            if isinstance(e, aiohttp.ClientResponseError) and e.status < 500:
+                raise
+            if attempt == MAX_ATTEMPTS:
+                raise
+            logger.warning("Download of %s interrupted (%s), resuming", url, e)
+            await asyncio.sleep(RETRY_BACKOFF_SEC * attempt)
+
+    actual_sha256 = await loop.run_in_executor(None, file_sha256, part_path)
+    if actual_sha256 != expected_sha256:
+        # a corrupt spool can't be resumed, next attempt starts from zero
+        os.remove(part_path)
+        raise ChecksumMismatch(
+            f"{url}: expected sha256 {expected_sha256}, got {actual_sha256}"
+        )
+    os.replace(part_path, dest_path)
+    return dest_path
@@ -1,100 +1,344 @@
+import asyncio
+import json
 import logging
 import pickle
-from typing import List, Tuple
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
 
+import aiohttp
 import dropbox
-import requests
 import yaml
+from dropbox import files
 from dropbox.files import FileMetadata, ListFolderResult
+from stone.backends.python_rsrc import stone_serializers
 
 OAUTH_PATH = "data/oauth.pickle"
 CONFIG_PATH = "data/dropbox.yaml"
+DECK_ROOT = "/MTG Decks"
+
+API_URL = "https://api.dropboxapi.com"
+CONTENT_URL = "https://content.dropboxapi.com"
+# refresh the access token this long before Dropbox says it expires
+TOKEN_EXPIRY_SLACK_SEC = 60
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# same limits as the SDK's transport: rate limits are retried for as long as
+# Dropbox asks, server errors and dropped connections this many times
+MAX_RETRIES_ON_ERROR = 4
+RETRY_BACKOFF_SEC = 1
+MAX_RETRY_BACKOFF_SEC = 60
 
 logger = logging.getLogger(__name__)
 
 
-class DropboxDeckClient:
+class DropboxRetriesExhausted(Exception):
+    pass
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Dropbox sends whole seconds
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+class AsyncDropboxDeckClient:
+    """
+    Talks to the Dropbox HTTP API directly over one pooled, keep-alive
+    aiohttp session instead of running the synchronous SDK in executor
+    threads. Results are decoded into the SDK types (FileMetadata).
+    """
+
     def __init__(
         self,
+        key: Optional[str] = None,
+        secret: Optional[str] = None,
+        refresh_token: Optional[str] = None,
+        api_url: str = API_URL,
+        content_url: str = CONTENT_URL,
+        max_connections: int = 16,
     ):
-        key, secret = load_key_secret()
-        refresh_token = load_refresh_token()
-        self.client = dropbox.Dropbox(
-            app_key=key,
-            app_secret=secret,
-            oauth2_refresh_token=refresh_token,
-        )
+        if key is None or secret is None:
+            key, secret = load_key_secret()
+        if refresh_token is None:
+            refresh_token = load_refresh_token()
+        self.key = key
+        self.secret = secret
+        self.refresh_token = refresh_token
+        self.api_url = api_url
+        self.content_url = content_url
+        self.max_connections = max_connections
 
-    def list_files(self) -> List[FileMetadata]:
-        files = []
-        res: ListFolderResult = self.client.files_list_folder(
-            "/MTG Decks", recursive=True
-        )
-        entry: FileMetadata
-        for entry in res.entries:
-            if getattr(entry, "is_downloadable", None):
-                files.append(entry)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._access_token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> "AsyncDropboxDeckClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # created lazily so the session binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections, keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def refresh_access_token(self) -> str:
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self._access_token and time.monotonic() < self._token_expires_at:
+                return self._access_token
+            async with self.session.post(
+                f"{self.api_url}/oauth2/token",
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": self.refresh_token,
+                    "client_id": self.key,
+                    "client_secret": self.secret,
+                },
+            ) as resp:
+                resp.raise_for_status()
+                token = await resp.json()
+            self._access_token = token["access_token"]
+            self._token_expires_at = (
+                time.monotonic()
+                + int(token.get("expires_in", 4 * 60 * 60))
+                - TOKEN_EXPIRY_SLACK_SEC
+            )
+            logger.debug("Refreshed Dropbox access token")
+            return self._access_token
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        token = self._access_token
+        if not token or time.monotonic() >= self._token_expires_at:
+            token = await self.refresh_access_token()
+        return {"Authorization": f"Bearer {token}"}
+
+    def _invalidate_token(self) -> None:
+        self._access_token = None
+        self._token_expires_at = 0.0
+
+    async def _post(
+        self,
+        url: str,
+        handle: Callable[[aiohttp.ClientResponse], Awaitable[Any]],
+        headers: Optional[Dict[str, str]] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        POST to url and return what handle makes of the response. Retries
+        once with a fresh token after a 401, and backs off and retries rate
+        limits, server errors and dropped connections, waiting as long as
+        Retry-After says when it is set.
+        """
+        attempt = 0
+        errors = 0
+        refreshed_token = False
+        while True:
+            request_headers = await self._auth_headers()
+            request_headers.update(headers or {})
+            retry_after = None
+            try:
+                async with self.session.post(
+                    url, headers=request_headers, **kwargs
+                ) as resp:
+                    if resp.status == 401 and not refreshed_token:
+                        refreshed_token = True
+                        self._invalidate_token()
+                        continue
+                    if resp.status != 429 and resp.status < 500:
+                        resp.raise_for_status()
+                        # read inside the loop so a body cut short is retried
+                        return await handle(resp)
+                    reason = f"HTTP {resp.status}"
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                    rate_limited = resp.status == 429
+            except (
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                asyncio.TimeoutError,
+            ) as e:
+                reason = repr(e)
+                rate_limited = False
+            if not rate_limited:
+                errors += 1
+                if errors > MAX_RETRIES_ON_ERROR:
+                    raise DropboxRetriesExhausted(f"{url}: {reason}")
+            if retry_after is None:
+                retry_after = min(RETRY_BACKOFF_SEC * 2**attempt, MAX_RETRY_BACKOFF_SEC)
+            attempt += 1
+            logger.warning("%s failed (%s), retrying in %ss", url, reason, retry_after)
+            await asyncio.sleep(retry_after)
 
-        while res.has_more:
-            res = self.client.files_list_folder_continue(res.cursor)
+    async def _rpc(self, route: str, arg: Dict[str, Any]) -> Any:
+        async def read_json(resp: aiohttp.ClientResponse) -> Any:
+            return await resp.json()
+
+        return await self._post(f"{self.api_url}/2/{route}", read_json, json=arg)
+
+    async def list_files(self, path: str = DECK_ROOT) -> List[FileMetadata]:
+        files_list = []
+        body = await self._rpc("files/list_folder", {"path": path, "recursive": True})
+        while True:
+            res: ListFolderResult = stone_serializers.json_compat_obj_decode(
+                files.ListFolderResult_validator, body, strict=False
+            )
+            entry: FileMetadata
             for entry in res.entries:
                 if getattr(entry, "is_downloadable", None):
-                    files.append(entry)
-        return files
+                    files_list.append(entry)
+            if not res.has_more:
+                return files_list
+            body = await self._rpc("files/list_folder/continue", {"cursor": res.cursor})
+
+    async def fetch_deck(
+        self, file_metadata: FileMetadata
+    ) -> Tuple[FileMetadata, bytes]:
+        return await self.fetch_path(file_metadata.path_display)
 
-    def fetch_deck(self, file_metadata: FileMetadata) -> Tuple[FileMetadata, bytes]:
-        resp: requests.models.Response
-        metadata, resp = self.client.files_download(file_metadata.path_display)
-        body = resp.content
+    async def fetch_path(self, path: str) -> Tuple[FileMetadata, bytes]:
+        async def read_deck(
+            resp: aiohttp.ClientResponse,
+        ) -> Tuple[FileMetadata, bytes]:
+            metadata: FileMetadata = stone_serializers.json_compat_obj_decode(
+                files.FileMetadata_validator,
+                json.loads(resp.headers["Dropbox-API-Result"]),
+                strict=False,
+            )
+            body = bytearray()
+            async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                body += chunk
+            return metadata, bytes(body)
+
+        metadata, body = await self._post(
+            f"{self.content_url}/2/files/download",
+            read_deck,
+            # Dropbox-API-Arg must be ASCII; json.dumps escapes everything else
+            headers={"Dropbox-API-Arg": json.dumps({"path": path})},
+        )
         logger.info("Fetched %s with length %d", metadata.path_display, len(body))
         return metadata, body
 
 
-def load_refresh_token():
-    with open(OAUTH_PATH, "rb") as f:
+class DropboxAccount(NamedTuple):
+    name: str
+    key: str
+    secret: str
+    oauth_path: str
+    roots: List[str]
+
+
+def load_accounts() -> Dict[str, DropboxAccount]:
+    """
+    The top level key/secret in dropbox.yaml is the "default" account. More
+    can be listed under "accounts", each with its own key, secret, oauth
+    pickle and deck roots, e.g.
+
+        key: ...
+        secret: ...
+        roots: ["/MTG Decks", "/Shop/Decks"]
+        accounts:
+          shop:
+            key: ...
+            secret: ...
+            oauth: data/oauth-shop.pickle
+            roots: ["/Decks"]
+    """
+    with open(CONFIG_PATH) as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    accounts = {}
+    if "key" in config:
+        accounts["default"] = DropboxAccount(
+            "default",
+            config["key"],
+            config["secret"],
+            OAUTH_PATH,
+            config.get("roots") or [DECK_ROOT],
+        )
+    for name, account in (config.get("accounts") or {}).items():
+        accounts[name] = DropboxAccount(
+            name,
+            account["key"],
+            account["secret"],
+            account.get("oauth") or f"data/oauth-{name}.pickle",
+            account.get("roots") or [DECK_ROOT],
+        )
+    return accounts
+
+
+def async_clients(
+    accounts: Dict[str, DropboxAccount],
+) -> Dict[str, AsyncDropboxDeckClient]:
+    return {
+        name: AsyncDropboxDeckClient(
+            account.key, account.secret, load_refresh_token(account.oauth_path)
+        )
+        for name, account in accounts.items()
+    }
+
+
+def load_refresh_token(oauth_path: str = OAUTH_PATH):
+    with open(oauth_path, "rb") as f:
         oauth_result: dropbox.oauth.OAuth2FlowNoRedirectResult = pickle.load(f)
         if type(oauth_result) == dropbox.oauth.OAuth2FlowNoRedirectResult:
             return oauth_result.refresh_token
 
 
-def oauth_flow(key: str, secret: str) -> str:
+def oauth_flow(key: str, secret: str, oauth_path: str = OAUTH_PATH) -> str:
     flow = dropbox.DropboxOAuth2FlowNoRedirect(key, secret, token_access_type="offline")
 
     print(flow.start())
     code = input("Enter auth code: ").strip()
     oauth_result = flow.finish(code)
-    with open("data/oauth.pickle", mode="wb") as f:
+    with open(oauth_path, mode="wb") as f:
         pickle.dump(oauth_result, f)
     return oauth_result.refresh_token
 
 
-def _file_list(key: str, secret: str, refresh_token):
+def _file_list(key: str, secret: str, refresh_token, roots: List[str]):
     with dropbox.Dropbox(
         app_key=key, app_secret=secret, oauth2_refresh_token=refresh_token
     ) as client:
-        res = client.files_list_folder("/MTG Decks", recursive=True)
-        for entry in res.entries:
-            print(entry)
-        while res.has_more:
-            res = client.files_list_folder_continue(res.cursor)
+        for root in roots:
+            res = client.files_list_folder(root, recursive=True)
             for entry in res.entries:
                 print(entry)
+            while res.has_more:
+                res = client.files_list_folder_continue(res.cursor)
+                for entry in res.entries:
+                    print(entry)
 
 
 def load_key_secret():
-    with open("data/dropbox.yaml") as f:
+    with open(CONFIG_PATH) as f:
         config = yaml.load(f, Loader=yaml.FullLoader)
     return config["key"], config["secret"]
 
 
 def setup_auth():
-    key, secret = load_key_secret()
-    try:
-        refresh_token = load_refresh_token()
-        _file_list(key, secret, refresh_token)
-    except Exception:
-        refresh_token = oauth_flow(key, secret)
-    _file_list(key, secret, refresh_token)
+    # every configured account needs its own oauth pickle before the poller
+    # or workers can start
+    for name, account in load_accounts().items():
+        print(f"Checking Dropbox account {name}")
+        try:
+            refresh_token = load_refresh_token(account.oauth_path)
+            _file_list(account.key, account.secret, refresh_token, account.roots)
+        except Exception:
+            refresh_token = oauth_flow(account.key, account.secret, account.oauth_path)
+        _file_list(account.key, account.secret, refresh_token, account.roots)
 
 
 if __name__ == "__main__":
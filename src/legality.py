@@ -0,0 +1,114 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy
+
+FORMATS = ("commander", "duel", "legacy", "modern", "penny", "vintage")
+SINGLETON_FORMATS = ("commander", "duel")
+COMMANDER_FORMATS = ("commander", "duel")
+CONSTRUCTED_COPY_LIMIT = 4
+COLORS = "WUBRG"
+
+ALL_FORMATS_MASK = (1 << len(FORMATS)) - 1
+# no card in a deck comes near this, used for basics and "any number" cards
+UNLIMITED_COPIES = 1 << 30
+
+
+def format_bits(formats: Iterable[str]) -> int:
+    mask = 0
+    for fmt in formats:
+        mask |= 1 << FORMATS.index(fmt)
+    return mask
+
+
+def color_bits(colors: Iterable[str]) -> int:
+    mask = 0
+    for color in colors:
+        if color in COLORS:
+            mask |= 1 << COLORS.index(color)
+    return mask
+
+
+def format_names(mask: int) -> List[str]:
+    return [fmt for i, fmt in enumerate(FORMATS) if mask & (1 << i)]
+
+
+COMMANDER_FORMATS_MASK = format_bits(COMMANDER_FORMATS)
+
+
+class LegalityTable:
+    """
+    Per-card legality, copy limits and color identity packed into arrays at
+    card database load, so a deck's legality in every format is a few numpy
+    reductions over the rows for its cards.
+    """
+
+    def __init__(self, cards: Iterable[Tuple[str, Dict[str, Any]]]):
+        self.index: Dict[str, int] = {}
+        legal, color_identity, copy_limits = [], [], []
+        base_limits = [
+            1 if fmt in SINGLETON_FORMATS else CONSTRUCTED_COPY_LIMIT for fmt in FORMATS
+        ]
+        for name, card in cards:
+            if name in self.index:
+                continue
+            self.index[name] = len(legal)
+            legalities = card.get("legalities") or {}
+            legal.append(
+                format_bits(
+                    fmt
+                    for fmt in FORMATS
+                    if legalities.get(fmt) in ("Legal", "Restricted")
+                )
+            )
+            color_identity.append(color_bits(card.get("colorIdentity") or []))
+            if "Basic" in (card.get("supertypes") or []) or (
+                "A deck can have any number of cards named" in (card.get("text") or "")
+            ):
+                copy_limits.append([UNLIMITED_COPIES] * len(FORMATS))
+            else:
+                copy_limits.append(
+                    [
+                        1 if legalities.get(fmt) == "Restricted" else limit
+                        for fmt, limit in zip(FORMATS, base_limits)
+                    ]
+                )
+        self.legal = numpy.array(legal, dtype=numpy.uint8)
+        self.color_identity = numpy.array(color_identity, dtype=numpy.uint8)
+        self.copy_limits = numpy.array(copy_limits, dtype=numpy.int32).reshape(
+            -1, len(FORMATS)
+        )
+        self.format_weights = numpy.array(
+            [1 << i for i in range(len(FORMATS))], dtype=numpy.uint8
+        )
+
+    def deck_legality(
+        self, cards: Iterable[str], commanders: Sequence[str] = ()
+    ) -> int:
+        """
+        Bitmask over FORMATS of the formats the deck is legal in. Cards not in
+        the database are ignored.
+        """
+        counts = Counter(card for card in cards if card in self.index)
+        if not counts:
+            return 0
+        rows = numpy.fromiter(
+            (self.index[card] for card in counts), dtype=numpy.intp, count=len(counts)
+        )
+        copies = numpy.fromiter(counts.values(), dtype=numpy.int32, count=len(counts))
+
+        mask = int(numpy.bitwise_and.reduce(self.legal[rows]))
+        over_limit = (copies[:, None] > self.copy_limits[rows]).any(axis=0)
+        mask &= ~int(over_limit @ self.format_weights) & ALL_FORMATS_MASK
+
+        if not commanders or any(c not in self.index for c in commanders):
+            return mask & ~COMMANDER_FORMATS_MASK
+        # partners and backgrounds pool their color identities
+        commander_rows = [self.index[commander] for commander in commanders]
+        commander_colors = int(
+            numpy.bitwise_or.reduce(self.color_identity[commander_rows])
+        )
+        deck_colors = int(numpy.bitwise_or.reduce(self.color_identity[rows]))
+        if deck_colors & ~commander_colors:
+            mask &= ~COMMANDER_FORMATS_MASK
+        return mask
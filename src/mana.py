@@ -0,0 +1,86 @@
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy
+
+COLORS = "WUBRG"
+# colored columns count every symbol that includes the color, which is what
+# devotion counts, so {W/U} adds to W, U and hybrid
+PIP_COLUMNS = ("W", "U", "B", "R", "G", "C", "generic", "hybrid", "phyrexian", "X")
+# mana values 0..6, then 7+
+MANA_VALUE_BUCKETS = 8
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+MANA_SYMBOL_RE = re.compile(r"\{([^}]+)\}")
+
+
+def parse_mana_cost(mana_cost: str) -> List[int]:
+    pips = [0] * len(PIP_COLUMNS)
+    for symbol in MANA_SYMBOL_RE.findall(mana_cost or ""):
+        parts = symbol.split("/")
+        if symbol.isdigit():
+            pips[PIP_COLUMNS.index("generic")] += int(symbol)
+            continue
+        if symbol == "X":
+            pips[PIP_COLUMNS.index("X")] += 1
+            continue
+        if "P" in parts:
+            pips[PIP_COLUMNS.index("phyrexian")] += 1
+        elif len(parts) > 1:
+            pips[PIP_COLUMNS.index("hybrid")] += 1
+        for part in parts:
+            if part in COLORS or part == "C":
+                pips[PIP_COLUMNS.index(part)] += 1
+    return pips
+
+
+class ManaTable:
+    """
+    Pip counts and a one-hot mana value bucket per card, parsed once at card
+    database load. A deck's devotion and curve are then one product of its
+    card counts with the table rows.
+    """
+
+    def __init__(self, cards: Iterable[Tuple[str, Dict[str, Any]]]):
+        self.index: Dict[str, int] = {}
+        rows = []
+        for name, card in cards:
+            if name in self.index:
+                continue
+            self.index[name] = len(rows)
+            row = parse_mana_cost(card.get("manaCost")) + [0] * MANA_VALUE_BUCKETS
+            # lands stay off the curve, same as Deck.cmcs
+            if "Land" not in (card.get("types") or []):
+                mana_value = card.get("manaValue", card.get("convertedManaCost")) or 0
+                bucket = min(int(mana_value), MANA_VALUE_BUCKETS - 1)
+                row[len(PIP_COLUMNS) + bucket] = 1
+            rows.append(row)
+        self.table = numpy.array(rows, dtype=numpy.float32).reshape(
+            -1, len(PIP_COLUMNS) + MANA_VALUE_BUCKETS
+        )
+
+    def deck_mana(self, cards: Iterable[str]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Returns (pip totals over PIP_COLUMNS, mana value histogram).
+        """
+        counts = Counter(card for card in cards if card in self.index)
+        rows = numpy.fromiter(
+            (self.index[card] for card in counts), dtype=numpy.intp, count=len(counts)
+        )
+        copies = numpy.fromiter(counts.values(), dtype=numpy.float32, count=len(counts))
+        totals = copies @ self.table[rows]
+        return (
+            totals[: len(PIP_COLUMNS)].astype(int),
+            totals[len(PIP_COLUMNS) :].astype(int),
+        )
+
+
+def sparkline(histogram: numpy.ndarray) -> str:
+    peak = histogram.max() if len(histogram) else 0
+    if not peak:
+        return " " * len(histogram)
+    return "".join(
+        SPARK_CHARS[int(round(count / peak * (len(SPARK_CHARS) - 1)))] if count else " "
+        for count in histogram
+    )
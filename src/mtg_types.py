@@ -1,8 +1,10 @@
 from typing import Dict, List, TypedDict
 
+import card_record_gen
 import card_type_gen
 
 Card = card_type_gen._Root
+CardRecord = card_record_gen.CardRecord
 
 
 class SetData(TypedDict):
@@ -2,14 +2,16 @@
 import json
 import logging
 import os
-import re
-import string
+from functools import cached_property
 
 import click
 import numpy
-import untangle
 from jinja2 import Template
 
+import deck_parser
+import legality
+import mana
+
 logging.basicConfig(level="DEBUG")
 
 VALID_EXTENSIONS = ["cod", "dec", "txt"]
@@ -18,6 +20,7 @@ OUTPUT_TEMPLATE = Template(
     """
 <html>
 <head>
+<meta charset="utf-8">
 <title>Deck Lists</title>
 
 <link
@@ -125,15 +128,24 @@ tr { border: none; }
 <tr>
 <th>Main / Side</th>
 <th>CMC</th>
+<th>Curve</th>
+<th class="thl">Devotion</th>
 <th colspan="5">Colors</th>
+<th colspan="{{formats | length}}">Legal</th>
 <th class="thl">View</th>
 <th class="thl">Download</th>
 </tr>
 </thead>
 {% for deck in decks %}
-<tr>
+<tr id="{{deck.path | e}}">
 <td class="tbnum">{{deck.main | length}} / {{deck.side | length}}</td>
 <td class="tbnum"><code>{{ deck.cmc_ascii }}</code></td>
+<td><code title="{{deck.curve_title}}">{{deck.curve_spark}}</code></td>
+<td>
+{% for color, count in deck.devotion.items() %}
+<span class="card-{{color | lower}}">{{count}}{{color}}</span>
+{% endfor %}
+</td>
 {% for color in "W U B R G".split(" ")%}
 <td>
 {% if color in deck.color_identity %}
@@ -141,6 +153,13 @@ tr { border: none; }
 {% endif %}
 </td>
 {% endfor %}
+{% for fmt in formats %}
+<td>
+{% if fmt in deck.legal_formats %}
+<span title="{{fmt}}">{{fmt[0] | upper}}</span>
+{% endif %}
+</td>
+{% endfor %}
 <td>
 <a
   href="javascript: tapped_out('{{deck.name | escape}}')">
@@ -154,6 +173,169 @@ tr { border: none; }
 {% endfor %}
 </table>
 
+<div id="footer">
+{% if index_href %}
+<a href="{{index_href | e}}">Index</a> &#xb7;
+{% endif %}
+<a href="https://github.com/nickgarvey/mtg-dropbox">GitHub</a>
+</div>
+</html>
+"""
+)
+
+# The index page never embeds decks, it loads the compact index written
+# alongside it and renders one screen of rows at a time, so it costs the same
+# to open no matter how many decks there are.
+INDEX_TEMPLATE = Template(
+    """
+<html>
+<head>
+<meta charset="utf-8">
+<title>Deck Lists</title>
+
+<link
+  rel="stylesheet"
+  href="https://unpkg.com/purecss@0.6.2/build/pure-min.css"
+  integrity="sha384-UQiGfs9ICog+LwheBSRCt1o5cbyKIHbwjWscjemyBMT9YCUMZffs6UqUTd0hObXD"
+  crossorigin="anonymous">
+
+<script type="text/javascript" src="{{index_src | e}}"></script>
+<script type="text/javascript">
+// DECK_INDEX.decks rows are
+// [name, path, page, main, side, cmc_ascii, colors, legal format initials,
+//  mana value sparkline]
+const ROWS_PER_SCREEN = 100;
+const COLORS = ["W", "U", "B", "R", "G"];
+let sort_column = 1;
+let sort_dir = 1;
+let offset = 0;
+let visible = DECK_INDEX.decks;
+
+function sort_by(column) {
+    sort_dir = column === sort_column ? -sort_dir : 1;
+    sort_column = column;
+    refilter();
+}
+
+function refilter() {
+    const needle = document.getElementById("filter").value.toLowerCase();
+    const color = document.getElementById("color").value;
+    visible = DECK_INDEX.decks.filter(function(deck) {
+        return (!needle || deck[1].toLowerCase().includes(needle))
+            && (!color || deck[6].includes(color));
+    });
+    visible.sort(function(a, b) {
+        return (a[sort_column] > b[sort_column] ? 1 :
+                a[sort_column] < b[sort_column] ? -1 : 0) * sort_dir;
+    });
+    offset = 0;
+    render();
+}
+
+function page(step) {
+    const next = offset + step * ROWS_PER_SCREEN;
+    if (next >= 0 && next < visible.length) {
+        offset = next;
+        render();
+    }
+}
+
+function render() {
+    const body = document.getElementById("decks");
+    body.innerHTML = "";
+    visible.slice(offset, offset + ROWS_PER_SCREEN).forEach(function(deck) {
+        const row = body.insertRow();
+        const counts = row.insertCell();
+        counts.className = "tbnum";
+        counts.textContent = deck[3] + " / " + deck[4];
+        const cmc = row.insertCell();
+        cmc.className = "tbnum";
+        cmc.innerHTML = "<code>" + deck[5] + "</code>";
+        const curve = document.createElement("code");
+        curve.textContent = deck[8];
+        row.insertCell().appendChild(curve);
+        COLORS.forEach(function(color) {
+            const cell = row.insertCell();
+            if (deck[6].includes(color)) {
+                const span = document.createElement("span");
+                span.className = "card-" + color.toLowerCase();
+                span.textContent = color;
+                cell.appendChild(span);
+            }
+        });
+        row.insertCell().textContent = deck[7];
+        const link = document.createElement("a");
+        link.href = DECK_INDEX.pages[deck[2]][1] + "#" + encodeURIComponent(deck[1]);
+        link.textContent = deck[1];
+        row.insertCell().appendChild(link);
+    });
+    document.getElementById("position").textContent =
+        (visible.length ? offset + 1 : 0) + "-"
+        + Math.min(offset + ROWS_PER_SCREEN, visible.length)
+        + " of " + visible.length;
+}
+
+window.onload = function() {
+    const pages = document.getElementById("pages");
+    DECK_INDEX.pages.forEach(function(entry) {
+        const item = document.createElement("li");
+        const link = document.createElement("a");
+        link.href = entry[1];
+        link.textContent = entry[0];
+        item.appendChild(link);
+        pages.appendChild(item);
+    });
+    refilter();
+};
+</script>
+
+<style type="text/css">
+body { margin: 20px }
+td { padding: 3px 5px }
+th { padding: 1px 5px; cursor: pointer }
+.thl { text-align: left }
+.tbnum { text-align: right }
+.card-r { color: red }
+.card-u { color: blue }
+.card-g { color: green }
+.card-b { color: black }
+.card-w { color: grey }
+#footer { margin: 20px 0 }
+a { text-decoration: none }
+
+table { border-collapse: collapse; }
+tr { border: none; }
+</style>
+</head>
+
+<body>
+<ul id="pages"></ul>
+
+<input id="filter" type="text" placeholder="Filter by path" oninput="refilter()">
+<select id="color" onchange="refilter()">
+<option value="">Any color</option>
+{% for color in "W U B R G".split(" ")%}
+<option value="{{color}}">{{color}}</option>
+{% endfor %}
+</select>
+<a href="javascript: page(-1)">&lt;</a>
+<span id="position"></span>
+<a href="javascript: page(1)">&gt;</a>
+
+<table>
+<thead>
+<tr>
+<th onclick="sort_by(3)">Main / Side</th>
+<th onclick="sort_by(5)">CMC</th>
+<th>Curve</th>
+<th colspan="5" onclick="sort_by(6)">Colors</th>
+<th onclick="sort_by(7)">Legal</th>
+<th class="thl" onclick="sort_by(1)">Deck</th>
+</tr>
+</thead>
+<tbody id="decks"></tbody>
+</table>
+
 <div id="footer">
 <a href="https://github.com/nickgarvey/mtg-dropbox">GitHub</a>
 </div>
@@ -166,6 +348,12 @@ class CardDatabase:
     def __init__(self, card_json_path):
         with open(card_json_path) as cjf:
             self.card_json = json.load(cjf)
+        self.legality = legality.LegalityTable(
+            (name, faces[0]) for name, faces in self.card_json["data"].items()
+        )
+        self.mana = mana.ManaTable(
+            (name, faces[0]) for name, faces in self.card_json["data"].items()
+        )
 
     def __getitem__(self, key):
         return self.card_json["data"][key]
@@ -181,7 +369,9 @@ class Deck:
     def __init__(self, path: str, database: CardDatabase):
         self.path = path
         self.database = database
-        self.main, self.side = load_cod(path) or load_txt(path) or (None, None)
+        self.main, self.side, self.commanders = (
+            load_cod(path) or load_txt(path) or (None, None, None)
+        )
 
     @property
     def valid(self):
@@ -220,6 +410,12 @@ class Deck:
     def name(self):
         return self.path.split("/")[-1]
 
+    @cached_property
+    def legal_formats(self):
+        return legality.format_names(
+            self.database.legality.deck_legality(self.main + self.side, self.commanders)
+        )
+
     @property
     def cmcs(self):
         return [
@@ -228,6 +424,32 @@ class Deck:
             if "Land" not in card["types"] and "convertedManaCost" in card
         ]
 
+    @cached_property
+    def mana_profile(self):
+        return self.database.mana.deck_mana(self.main)
+
+    @property
+    def devotion(self):
+        pips, _ = self.mana_profile
+        return {
+            color: int(pips[mana.PIP_COLUMNS.index(color)])
+            for color in mana.COLORS
+            if pips[mana.PIP_COLUMNS.index(color)]
+        }
+
+    @property
+    def curve_spark(self):
+        _, histogram = self.mana_profile
+        return mana.sparkline(histogram)
+
+    @property
+    def curve_title(self):
+        _, histogram = self.mana_profile
+        return ", ".join(
+            "%s%s: %d" % (i, "+" if i == len(histogram) - 1 else "", count)
+            for i, count in enumerate(histogram)
+        )
+
     @property
     def cmc_ascii(self):
         if not self.cmcs:
@@ -256,65 +478,100 @@ def find_decks(root_dir):
 
 def load_cod(deck_path):
     try:
-        deck = untangle.parse(deck_path)
+        with open(deck_path, "rb") as deck_file:
+            return deck_parser.parse_cod(deck_file.read())
     except Exception:
         return None
 
-    main = []
-    side_board = []
-    for zone in deck.cockatrice_deck.zone:
-        for card in zone.card:
-            if zone["name"] == "tokens":
-                continue
-            elif zone["name"] == "side":
-                side_board += [card["name"]] * int(card["number"] or 0)
-            else:
-                main += [card["name"]] * int(card["number"] or 0)
-    return main, side_board
-
 
 def load_txt(deck_path):
-    main = []
-    side_board = []
-    saw_sideboard = False
-    with open(deck_path) as deck_file:
-        for line in deck_file:
-            line = line.strip()
-            if not line:
-                continue
-            if line in ["Companion", "Deck", "Commander"]:
-                continue
-            if "Sideboard" in line:
-                saw_sideboard = True
-                continue
-
-            match = re.match(r"(SB: *)?([0-9]*)?\s*([^\n\r(]+)(?: \(.*)?$", line)
-            if not match:
-                continue
-            sb, number, card = match.groups()
-            if not set(card) & set(string.ascii_letters):
-                continue
-            to_add = [card] * int(number or 1)
-            if sb or saw_sideboard:
-                side_board += to_add
-            else:
-                main += to_add
-
-    return main, side_board
+    with open(deck_path, "rb") as deck_file:
+        return deck_parser.parse_txt(deck_file.read())
 
 
-def write_analysis(decks, output_file):
+def write_analysis(decks, output_file, index_href=None):
     logging.debug("Rendering output")
-    render = OUTPUT_TEMPLATE.render(decks=decks)
+    render = OUTPUT_TEMPLATE.render(
+        decks=decks, formats=legality.FORMATS, index_href=index_href
+    )
     logging.debug("Rendered output length: %d", len(render))
     output_file.write(render)
 
 
+def shard_decks(decks, shard_by, shard_size):
+    if shard_by == "folder":
+        folders = {}
+        for deck in decks:
+            folders.setdefault(os.path.dirname(deck.path) or ".", []).append(deck)
+        return sorted(folders.items())
+    return [
+        (
+            "%s - %s"
+            % (decks[i].name, decks[min(i + shard_size, len(decks)) - 1].name),
+            decks[i : i + shard_size],
+        )
+        for i in range(0, len(decks), shard_size)
+    ]
+
+
+def write_sharded_analysis(decks, output_path, shard_by, shard_size):
+    # pages sit next to the index so relative deck download links keep working
+    output_dir = os.path.dirname(output_path)
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    index = {"pages": [], "decks": []}
+    for page_num, (label, page_decks) in enumerate(
+        shard_decks(decks, shard_by, shard_size)
+    ):
+        page_href = "%s-%d.html" % (stem, page_num)
+        index["pages"].append([label, page_href])
+        index["decks"] += [
+            [
+                deck.name,
+                deck.path,
+                page_num,
+                len(deck.main),
+                len(deck.side),
+                deck.cmc_ascii,
+                "".join(sorted(deck.color_identity)),
+                "".join(fmt[0].upper() for fmt in deck.legal_formats),
+                deck.curve_spark,
+            ]
+            for deck in page_decks
+        ]
+        logging.debug("Writing page %s with %d decks", page_href, len(page_decks))
+        with open(
+            os.path.join(output_dir, page_href), "w", encoding="utf-8"
+        ) as page_file:
+            write_analysis(
+                page_decks, page_file, index_href=os.path.basename(output_path)
+            )
+
+    index_src = "%s-index.js" % stem
+    with open(os.path.join(output_dir, index_src), "w") as index_file:
+        index_file.write("const DECK_INDEX = ")
+        json.dump(index, index_file, separators=(",", ":"))
+        index_file.write(";\n")
+    with open(output_path, "w", encoding="utf-8") as output:
+        output.write(INDEX_TEMPLATE.render(index_src=index_src))
+
+
 @click.command()
 @click.argument("root_dir")
 @click.argument("card_json")
 @click.argument("output_path")
-def main(root_dir, card_json, output_path):
+@click.option(
+    "--shard-by",
+    type=click.Choice(["none", "folder", "size"]),
+    default="none",
+    help="Write an index page plus one page per folder or per fixed-size shard",
+)
+@click.option(
+    "--shard-size",
+    type=click.IntRange(min=1),
+    default=500,
+    help="Decks per page with --shard-by size",
+)
+def main(root_dir, card_json, output_path, shard_by, shard_size):
     logging.debug("Loading Card DB")
     database = CardDatabase(card_json)
 
@@ -331,7 +588,10 @@ def main(root_dir, card_json, output_path):
             decks.append(deck)
     # write analysis
     logging.debug("Writing output file %s", output_path)
-    with open(output_path, "w") as output:
+    if shard_by != "none":
+        write_sharded_analysis(decks, output_path, shard_by, shard_size)
+        return
+    with open(output_path, "w", encoding="utf-8") as output:
         write_analysis(decks, output)
 
 
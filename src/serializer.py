@@ -23,3 +23,9 @@ def d(buf: Optional[bytes]) -> Any:
             return msgpack.load(reader)
     except ValueError:
         return None
+
+
+def unpacker(buf: bytes) -> msgpack.Unpacker:
+    # for walking large documents incrementally instead of loading them whole
+    dctx = zstandard.ZstdDecompressor()
+    return msgpack.Unpacker(dctx.stream_reader(buf))
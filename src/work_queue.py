@@ -0,0 +1,137 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import redis
+
+from serializer import s, d
+
+DEFAULT_VISIBILITY_TIMEOUT_SEC = 5 * 60
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Add a job unless it is already queued or leased, in which case only its
+# payload is replaced (and its attempts reset) if it changed. A payload
+# that already went to the dead letters is not retried.
+ENQUEUE_SCRIPT = """
+if redis.call("HGET", KEYS[4], ARGV[1]) == ARGV[2] then
+    return 0
+end
+local current = redis.call("HGET", KEYS[2], ARGV[1])
+if current then
+    if current ~= ARGV[2] then
+        redis.call("HSET", KEYS[2], ARGV[1], ARGV[2])
+        redis.call("HDEL", KEYS[3], ARGV[1])
+    end
+    return 0
+end
+redis.call("HDEL", KEYS[4], ARGV[1])
+redis.call("HSET", KEYS[2], ARGV[1], ARGV[2])
+redis.call("LPUSH", KEYS[1], ARGV[1])
+return 1
+"""
+
+# Put jobs whose lease expired back on the pending list, then move one
+# pending job into the lease set. Jobs claimed more than max attempts times
+# go to the dead letters instead. Runs atomically so two workers can never
+# claim the same job.
+CLAIM_SCRIPT = """
+local expired = redis.call("ZRANGEBYSCORE", KEYS[2], "-inf", ARGV[1])
+for _, job_id in ipairs(expired) do
+    redis.call("ZREM", KEYS[2], job_id)
+    redis.call("RPUSH", KEYS[1], job_id)
+end
+while true do
+    local job_id = redis.call("RPOP", KEYS[1])
+    if not job_id then
+        return nil
+    end
+    local attempts = redis.call("HINCRBY", KEYS[4], job_id, 1)
+    local job = redis.call("HGET", KEYS[3], job_id)
+    if not job then
+        -- acked while it sat requeued
+        redis.call("HDEL", KEYS[4], job_id)
+    elseif attempts > tonumber(ARGV[3]) then
+        redis.call("HSET", KEYS[5], job_id, job)
+        redis.call("HDEL", KEYS[3], job_id)
+        redis.call("HDEL", KEYS[4], job_id)
+    else
+        redis.call("ZADD", KEYS[2], ARGV[2], job_id)
+        return {job_id, job}
+    end
+end
+"""
+
+
+class WorkQueue:
+    """
+    At-least-once job queue in Redis. Claimed jobs are leased for a
+    visibility timeout and handed to another worker if not acked before it
+    runs out, up to max_attempts claims, after which they are moved to the
+    dead letters.
+    """
+
+    def __init__(
+        self,
+        r: redis.Redis,
+        name: str,
+        visibility_timeout_sec: int = DEFAULT_VISIBILITY_TIMEOUT_SEC,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.r = r
+        self.visibility_timeout_sec = visibility_timeout_sec
+        self.max_attempts = max_attempts
+        self.pending_key = f"queue/{name}/pending"
+        self.leases_key = f"queue/{name}/leases"
+        self.jobs_key = f"queue/{name}/jobs"
+        self.attempts_key = f"queue/{name}/attempts"
+        self.dead_key = f"queue/{name}/dead"
+        self._enqueue = r.register_script(ENQUEUE_SCRIPT)
+        self._claim = r.register_script(CLAIM_SCRIPT)
+
+    def enqueue(self, job_id: str, job: Any) -> bool:
+        return bool(
+            self._enqueue(
+                keys=[
+                    self.pending_key,
+                    self.jobs_key,
+                    self.attempts_key,
+                    self.dead_key,
+                ],
+                args=[job_id, s(job)],
+            )
+        )
+
+    def claim(self) -> Optional[Tuple[str, Any]]:
+        now = time.time()
+        res = self._claim(
+            keys=[
+                self.pending_key,
+                self.leases_key,
+                self.jobs_key,
+                self.attempts_key,
+                self.dead_key,
+            ],
+            args=[now, now + self.visibility_timeout_sec, self.max_attempts],
+        )
+        if not res:
+            return None
+        job_id, job = res
+        return job_id.decode("utf-8"), d(job)
+
+    def ack(self, job_id: str) -> bool:
+        # the lease may have expired and the job been requeued meanwhile
+        pipe = self.r.pipeline()
+        pipe.zrem(self.leases_key, job_id)
+        pipe.lrem(self.pending_key, 0, job_id)
+        pipe.hdel(self.jobs_key, job_id)
+        pipe.hdel(self.attempts_key, job_id)
+        leased, pending, _, _ = pipe.execute()
+        return bool(leased or pending)
+
+    def dead_letters(self) -> Dict[str, Any]:
+        return {
+            job_id.decode("utf-8"): d(job)
+            for job_id, job in self.r.hgetall(self.dead_key).items()
+        }
+
+    def __len__(self) -> int:
+        return self.r.llen(self.pending_key) + self.r.zcard(self.leases_key)
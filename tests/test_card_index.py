@@ -0,0 +1,59 @@
+import fakeredis
+import pytest
+
+import app
+import card_index
+from card_index import CardIndex
+
+
+@pytest.fixture
+def index():
+    index = CardIndex(fakeredis.FakeRedis())
+    index.set_deck_paths({"h1": "/MTG Decks/a.txt", "h2": "/MTG Decks/b.cod"})
+    index.add_deck("h1", ["Sol Ring", "Arcane Signet", "Lightning Bolt"])
+    index.add_deck("h2", ["Lightning Helix", "Lim-Dûl's Vault"])
+    return index
+
+
+def search(index, query):
+    decks, truncated = index.search(query)
+    return index.deck_paths(decks), truncated
+
+
+def test_and_or_queries(index):
+    assert search(index, "sol ring") == (["/MTG Decks/a.txt"], False)
+    assert search(index, "Sol Ring AND Lightning Helix") == ([], False)
+    assert search(index, "Sol Ring OR Lightning Helix")[0] == [
+        "/MTG Decks/a.txt",
+        "/MTG Decks/b.cod",
+    ]
+    assert search(index, "Lightning* AND Arcane Signet")[0] == ["/MTG Decks/a.txt"]
+
+
+def test_prefix_and_normalized_names(index):
+    assert search(index, "light*")[0] == ["/MTG Decks/a.txt", "/MTG Decks/b.cod"]
+    assert search(index, "lim-dul's vault")[0] == ["/MTG Decks/b.cod"]
+    assert search(index, "nope*") == ([], False)
+
+
+def test_removed_deck_leaves_index(index):
+    index.remove_decks(["h1"])
+    assert search(index, "light*")[0] == ["/MTG Decks/b.cod"]
+    assert index.expand("sol*") == ([], False)
+
+
+def test_broad_prefix_is_flagged(index, monkeypatch):
+    monkeypatch.setattr(card_index, "MAX_PREFIX_EXPANSION", 1)
+    decks, truncated = search(index, "light*")
+    assert truncated
+    assert len(decks) == 1
+
+
+def test_search_endpoint(index, monkeypatch):
+    monkeypatch.setattr(app, "card_index", index)
+    resp = app.app.test_client().get("/search", query_string={"q": "sol ring"})
+    assert resp.get_json() == {
+        "query": "sol ring",
+        "decks": ["/MTG Decks/a.txt"],
+        "truncated": False,
+    }
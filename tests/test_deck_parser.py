@@ -0,0 +1,82 @@
+import xml.sax
+
+import pytest
+
+import card_record_gen
+from deck_parser import DeckParser, parse_cod, parse_deck_contents
+from serializer import s, unpacker
+
+ALL_PRINTINGS = {
+    "meta": {"date": "2024-01-01"},
+    "data": {
+        "LEA": {
+            "name": "Limited Edition Alpha",
+            "cards": [
+                {
+                    "name": "Lightning Bolt",
+                    "manaCost": "{R}",
+                    "colorIdentity": ["R"],
+                    "foreignData": [{"language": "German", "name": "Blitzschlag"}],
+                    "legalities": {"modern": "Legal"},
+                },
+                {"name": "Sol Ring", "manaCost": "{1}", "types": ["Artifact"]},
+            ],
+            "tokens": [{"name": "Goblin"}],
+        }
+    },
+}
+
+
+def card_records():
+    records = card_record_gen.read_all_printings(unpacker(s(ALL_PRINTINGS)))
+    return {record.name: record for record in records}
+
+
+def test_read_all_printings_keeps_declared_fields_only():
+    bolt = card_records()["Lightning Bolt"]
+    assert bolt.mana_cost == "{R}"
+    assert bolt.legalities == {"modern": "Legal"}
+    assert not hasattr(bolt, "foreignData")
+    assert not hasattr(bolt, "__dict__")
+
+
+def test_parse_txt_and_cod():
+    assert parse_deck_contents(
+        b"Commander\n1 Sol Ring\nDeck\n4 Lightning Bolt (M10) 146\nSideboard\n1 Shock\n"
+    ) == (["Sol Ring"] + ["Lightning Bolt"] * 4, ["Shock"], ["Sol Ring"])
+    assert parse_deck_contents(
+        b'<?xml version="1.0"?><cockatrice_deck version="1">'
+        b'<zone name="main"><card number="2" name="Sol Ring"/></zone>'
+        b'<zone name="side"><card number="1" name="Lightning Bolt"/></zone>'
+        b'<zone name="tokens"><card number="1" name="Goblin"/></zone>'
+        b"</cockatrice_deck>"
+    ) == (["Sol Ring"] * 2, ["Lightning Bolt"], [])
+
+
+def test_parse_deck_resolves_card_records():
+    deck = DeckParser(card_records(), None).parse_deck(
+        b"4 Lightning Bolt\n1 Not A Card\nSB: 1 Sol Ring\n"
+    )
+    assert [card.name for card in deck.mainboard] == ["Lightning Bolt"] * 4
+    assert deck.card_names() == ["Lightning Bolt", "Sol Ring"]
+
+
+def test_cod_contents_are_never_opened_as_a_path(tmp_path):
+    secret = tmp_path / "secret.xml"
+    secret.write_text(
+        '<cockatrice_deck><zone name="main">'
+        '<card number="1" name="Sol Ring"/></zone></cockatrice_deck>'
+    )
+    with pytest.raises(xml.sax.SAXParseException):
+        parse_cod(str(secret).encode("utf-8"))
+    with pytest.raises(xml.sax.SAXParseException):
+        parse_cod(b"https://example.com/deck.cod")
+
+
+def test_cod_honors_encoding_declaration():
+    deck = (
+        '<?xml version="1.0" encoding="ISO-8859-1"?>'
+        '<cockatrice_deck><zone name="main">'
+        '<card number="2" name="Lim-D\xfbl\'s Vault"/></zone></cockatrice_deck>'
+    ).encode("iso-8859-1")
+    assert parse_cod(deck) == (["Lim-Dûl's Vault"] * 2, [], [])
@@ -0,0 +1,340 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import lzma
+import os
+import types
+
+import aiohttp
+import fakeredis
+import pytest
+from aiohttp import web
+
+import deck_poller
+from card_index import CardIndex
+from serializer import s
+
+
+def publish_cards(r, version, names):
+    cards = [{"name": name} for name in names]
+    r.set(deck_poller.all_printings_key(version), s({"data": {"X": {"cards": cards}}}))
+    r.set(deck_poller.CARD_VERSION_KEY, version)
+
+
+def test_deck_parser_cache_follows_published_version():
+    r = fakeredis.FakeRedis()
+    cache = deck_poller.DeckParserCache(r)
+
+    async def names(deck):
+        deck_parser = await cache.get()
+        return deck_parser and deck_parser.parse_deck(deck).card_names()
+
+    assert asyncio.run(names(b"1 Sol Ring\n")) is None
+
+    publish_cards(r, "v1", ["Sol Ring"])
+    first = asyncio.run(cache.get())
+    assert asyncio.run(names(b"1 Sol Ring\n1 Mox Opal\n")) == ["Sol Ring"]
+    assert asyncio.run(cache.get()) is first
+
+    publish_cards(r, "v2", ["Sol Ring", "Mox Opal"])
+    assert asyncio.run(names(b"1 Sol Ring\n1 Mox Opal\n")) == ["Mox Opal", "Sol Ring"]
+
+
+class LeaderPoller(deck_poller.DeckPoller):
+    def __init__(self, r, refresh):
+        self.r = r
+        self.card_version = None
+        self.refresh = refresh
+
+    async def refresh_cards_leader(self, mtg_json_poll_interval_sec, lock):
+        return await self.refresh(self, lock)
+
+
+def test_refresh_cards_falls_back_when_lease_is_lost():
+    r = fakeredis.FakeRedis()
+    publish_cards(r, "v1", ["Sol Ring"])
+
+    async def lose_lease(poller, lock):
+        # another replica grabbed the expired lease
+        r.set(deck_poller.CARD_REFRESH_LOCK, "someone else")
+        lock.reacquire()
+
+    poller = LeaderPoller(r, lose_lease)
+    assert not asyncio.run(poller.refresh_cards(60))
+    assert poller.card_version == b"v1"
+
+
+def test_only_one_replica_refreshes_cards(monkeypatch):
+    monkeypatch.setattr(deck_poller, "CARD_REFRESH_WAIT_SEC", 0.01)
+    r = fakeredis.FakeRedis()
+    publish_cards(r, "v1", ["Sol Ring"])
+    leaders = []
+
+    async def publish(poller, lock):
+        leaders.append(poller)
+        await asyncio.sleep(0.1)
+        lock.reacquire()
+        publish_cards(r, "v2", ["Sol Ring", "Mox Opal"])
+        poller.card_version = b"v2"
+        return True
+
+    pollers = [LeaderPoller(r, publish), LeaderPoller(r, publish)]
+
+    async def refresh_all():
+        return await asyncio.gather(*(poller.refresh_cards(60) for poller in pollers))
+
+    updated = asyncio.run(refresh_all())
+    assert len(leaders) == 1
+    assert updated[pollers.index(leaders[0])]
+    assert [poller.card_version for poller in pollers] == [b"v2", b"v2"]
+    assert not r.exists(deck_poller.CARD_REFRESH_LOCK)
+
+
+def test_card_refresh_lease_is_renewed_while_leader_runs(monkeypatch):
+    monkeypatch.setattr(deck_poller, "CARD_REFRESH_LEASE_SEC", 0.2)
+    monkeypatch.setattr(deck_poller, "CARD_REFRESH_RENEW_SEC", 0.05)
+    r = fakeredis.FakeRedis()
+
+    async def slow_publish(poller, lock):
+        # outlives the lease several times over without touching it
+        await asyncio.sleep(0.6)
+        lock.reacquire()
+        publish_cards(r, "v1", ["Sol Ring"])
+        poller.card_version = b"v1"
+        return True
+
+    assert asyncio.run(LeaderPoller(r, slow_publish).refresh_cards(60))
+
+
+class StubMtgJson:
+    def __init__(self, version, names):
+        self.version = version
+        self.all_printings = lzma.compress(
+            json.dumps(
+                {"data": {"X": {"cards": [{"name": name} for name in names]}}}
+            ).encode("utf-8")
+        )
+        self.fail_downloads = 0
+
+    async def meta(self, request):
+        return web.json_response({"meta": {"date": self.version}})
+
+    async def sha256(self, request):
+        return web.Response(text=hashlib.sha256(self.all_printings).hexdigest())
+
+    async def download(self, request):
+        if self.fail_downloads:
+            self.fail_downloads -= 1
+            return web.Response(status=404)
+        return web.Response(body=self.all_printings)
+
+
+async def refresh_from_stub(stub, poller, monkeypatch):
+    app = web.Application()
+    app.add_routes(
+        [
+            web.get("/Meta.json", stub.meta),
+            web.get("/AllPrintings.json.xz", stub.download),
+            web.get("/AllPrintings.json.xz.sha256", stub.sha256),
+        ]
+    )
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f"http://{host}:{port}"
+    monkeypatch.setattr(deck_poller, "META_URL", f"{url}/Meta.json")
+    monkeypatch.setattr(deck_poller, "ALL_PRINTINGS_URL", f"{url}/AllPrintings.json.xz")
+    monkeypatch.setattr(
+        deck_poller,
+        "ALL_PRINTINGS_SHA256_URL",
+        f"{url}/AllPrintings.json.xz.sha256",
+    )
+    try:
+        return await poller.refresh_cards(60)
+    finally:
+        await runner.cleanup()
+
+
+class CardPoller(deck_poller.DeckPoller):
+    def __init__(self, r):
+        self.r = r
+        self.card_version = None
+
+
+def test_card_refresh_publishes_and_cleans_up_spools(tmp_path, monkeypatch):
+    monkeypatch.setattr(deck_poller, "MTG_JSON_DIR", str(tmp_path))
+    r = fakeredis.FakeRedis()
+    publish_cards(r, "2024-01-01", ["Sol Ring"])
+    stale = tmp_path / "AllPrintings-2023-01-01.json.xz.part"
+    stale.write_bytes(b"abandoned")
+    stub = StubMtgJson("2024-02-01", ["Sol Ring", "Mox Opal"])
+    stub.fail_downloads = 1
+    poller = CardPoller(r)
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(refresh_from_stub(stub, poller, monkeypatch))
+    # not stamped, so the next poll tries again right away
+    assert not r.exists("last_meta_poll")
+
+    assert asyncio.run(refresh_from_stub(stub, poller, monkeypatch))
+    assert poller.card_version == b"2024-02-01"
+    assert r.get(deck_poller.CARD_VERSION_KEY) == b"2024-02-01"
+    assert sorted(deck_poller.load_card_records(r)) == ["Mox Opal", "Sol Ring"]
+    assert r.exists("last_meta_poll")
+    assert os.listdir(tmp_path) == []
+
+
+class FakeClient:
+    def __init__(self, decks):
+        self.decks = decks
+
+    async def fetch_deck(self, metadata):
+        await asyncio.sleep(0)
+        return metadata, self.decks[metadata.content_hash]
+
+
+class PipelinePoller(deck_poller.DeckPoller):
+    def __init__(self, r, decks, refresh):
+        self.r = r
+        self.dropbox_clients = {"default": FakeClient(decks)}
+        self.queue = None
+        self.card_version = None
+        self.card_index = CardIndex(r)
+        self.process_pool = concurrent.futures.ThreadPoolExecutor()
+        self.deck_parsers = deck_poller.DeckParserCache(r)
+        self.refresh = refresh
+        self.indexed = []
+
+    async def refresh_cards(self, mtg_json_poll_interval_sec):
+        return await self.refresh(self)
+
+    async def fetch_dropbox_metadata(self):
+        return [
+            (
+                "default",
+                types.SimpleNamespace(
+                    name=f"{deck_hash}.txt",
+                    path_display=f"/MTG Decks/{deck_hash}.txt",
+                    content_hash=deck_hash,
+                ),
+            )
+            for deck_hash in self.dropbox_clients["default"].decks
+        ]
+
+    async def index_decks(self, card_task, parsed_decks, indexed):
+        self.indexed += [deck_hash for deck_hash, _ in parsed_decks]
+        await super().index_decks(card_task, parsed_decks, indexed)
+
+
+def many_decks():
+    # more than the bounded pipeline queue holds
+    return {
+        f"deck{i}": b"1 Sol Ring\n" for i in range(deck_poller.PIPELINE_QUEUE_SIZE * 2)
+    }
+
+
+def test_downloads_finish_while_card_refresh_is_running():
+    r = fakeredis.FakeRedis()
+    decks = many_decks()
+    saved = asyncio.Event()
+
+    async def slow_refresh(poller):
+        await saved.wait()
+        publish_cards(r, "v1", ["Sol Ring"])
+        return poller.load_published_cards()
+
+    poller = PipelinePoller(r, decks, slow_refresh)
+
+    async def poll():
+        poll_task = asyncio.create_task(poller.poll_loop())
+        while len(list(r.scan_iter(match="decks/*"))) < len(decks):
+            await asyncio.sleep(0.01)
+        saved.set()
+        await poll_task
+
+    asyncio.run(poll())
+    assert poller.card_index.search("sol ring")[0] == set(decks)
+
+
+def test_failed_card_refresh_still_saves_decks():
+    r = fakeredis.FakeRedis()
+    decks = many_decks()
+
+    async def failing_refresh(poller):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("MTGJSON is down")
+
+    poller = PipelinePoller(r, decks, failing_refresh)
+    asyncio.run(asyncio.wait_for(poller.poll_loop(), 5))
+    assert len(list(r.scan_iter(match="decks/*"))) == len(decks)
+    assert poller.card_index.is_empty()
+
+    # the next poll indexes them even though the card data did not change,
+    # without reparsing decks that were already indexed
+    unindexed = set(decks)
+    publish_cards(r, "v1", ["Sol Ring", "Mox Opal"])
+    poller.card_version = b"v1"
+    poller.dropbox_clients["default"].decks["other"] = b"1 Mox Opal\n"
+    r.set("decks/other", s(b"1 Mox Opal\n"))
+    poller.card_index.add_deck("other", ["Mox Opal"])
+
+    async def refresh(poller):
+        return poller.load_published_cards()
+
+    poller.refresh = refresh
+    poller.indexed = []
+    asyncio.run(poller.poll_loop())
+    assert poller.card_index.search("sol ring")[0] == unindexed
+    assert sorted(poller.indexed) == sorted(unindexed)
+    assert not r.exists(deck_poller.UNINDEXED_DECKS_KEY)
+
+
+def test_card_update_does_not_reparse_new_downloads():
+    r = fakeredis.FakeRedis()
+    publish_cards(r, "v1", ["Sol Ring"])
+    r.set("decks/old", s(b"1 Sol Ring\n"))
+
+    async def update_cards(poller):
+        poller.card_version = b"v1"
+        publish_cards(r, "v2", ["Sol Ring"])
+        return poller.load_published_cards()
+
+    poller = PipelinePoller(
+        r, {"old": b"1 Sol Ring\n", "new": b"1 Sol Ring\n"}, update_cards
+    )
+    asyncio.run(poller.poll_loop())
+    assert sorted(poller.indexed) == ["new", "old"]
+
+
+class FakePathClient:
+    async def fetch_path(self, path):
+        deck_hash = path.rsplit("/", 1)[-1]
+        metadata = types.SimpleNamespace(
+            name=deck_hash, path_display=path, content_hash=deck_hash
+        )
+        return metadata, b"1 Sol Ring\n"
+
+
+class StubWorker(deck_poller.DeckWorker):
+    def __init__(self, r):
+        self.dropbox_clients = {"default": FakePathClient()}
+        self.r = r
+        self.card_index = CardIndex(r)
+        self.deck_parsers = deck_poller.DeckParserCache(r)
+        self.process_pool = concurrent.futures.ThreadPoolExecutor()
+
+
+def test_worker_leaves_decks_it_cannot_index_to_the_poller():
+    r = fakeredis.FakeRedis()
+    worker = StubWorker(r)
+
+    asyncio.run(worker.handle({"account": "default", "path": "/MTG Decks/early"}))
+    assert r.sismember(deck_poller.UNINDEXED_DECKS_KEY, "early")
+
+    publish_cards(r, "v1", ["Sol Ring"])
+    asyncio.run(worker.handle({"account": "default", "path": "/MTG Decks/late"}))
+    assert not r.sismember(deck_poller.UNINDEXED_DECKS_KEY, "late")
+    assert worker.card_index.search("sol ring")[0] == {"late"}
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import os
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import download
+
+CUT_EVERY = 100_000
+DATA = os.urandom(350_000)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(download, "RETRY_BACKOFF_SEC", 0)
+
+
+class FlakyServer:
+    """
+    Serves DATA but drops the connection every CUT_EVERY bytes, honoring
+    Range requests unless support_range is off.
+    """
+
+    def __init__(self, support_range=True, errors=()):
+        self.support_range = support_range
+        # statuses to answer the first requests with
+        self.errors = list(errors)
+        self.starts = []
+
+    async def data(self, request):
+        if self.errors:
+            return web.Response(status=self.errors.pop(0))
+        range_header = request.headers.get("Range")
+        start = 0
+        if range_header and self.support_range:
+            start = int(range_header[len("bytes=") : -1])
+        self.starts.append(start)
+        if start >= len(DATA):
+            return web.Response(status=416)
+        resp = web.StreamResponse(
+            status=206 if start else 200,
+            headers={"Content-Length": str(len(DATA) - start)},
+        )
+        await resp.prepare(request)
+        end = start + CUT_EVERY
+        await resp.write(DATA[start:end])
+        if end < len(DATA) and (self.support_range or len(self.starts) < 2):
+            request.transport.close()
+            return resp
+        await resp.write(DATA[end:])
+        await resp.write_eof()
+        return resp
+
+    async def sha256(self, request):
+        return web.Response(text=f"{SHA256}  AllPrintings.json.xz\n")
+
+
+async def run_with_server(server, test):
+    app = web.Application()
+    app.add_routes(
+        [web.get("/data", server.data), web.get("/data.sha256", server.sha256)]
+    )
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    try:
+        async with aiohttp.ClientSession() as session:
+            return await test(session, f"http://{host}:{port}")
+    finally:
+        await runner.cleanup()
+
+
+def test_resumes_after_dropped_connections(tmp_path):
+    server = FlakyServer()
+    dest = str(tmp_path / "AllPrintings.json.xz")
+
+    async def fetch(session, url):
+        expected = await download.fetch_sha256(session, f"{url}/data.sha256")
+        return await download.download_resumable(session, f"{url}/data", dest, expected)
+
+    assert asyncio.run(run_with_server(server, fetch)) == dest
+    assert server.starts == [0, 100_000, 200_000, 300_000]
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+    assert not os.path.exists(dest + ".part")
+
+
+def test_restarts_when_range_is_ignored(tmp_path):
+    server = FlakyServer(support_range=False)
+    dest = str(tmp_path / "AllPrintings.json.xz")
+
+    async def fetch(session, url):
+        return await download.download_resumable(session, f"{url}/data", dest, SHA256)
+
+    asyncio.run(run_with_server(server, fetch))
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_checksum_mismatch_discards_spool(tmp_path):
+    server = FlakyServer()
+    dest = str(tmp_path / "AllPrintings.json.xz")
+
+    async def fetch(session, url):
+        return await download.download_resumable(session, f"{url}/data", dest, "0" * 64)
+
+    with pytest.raises(download.ChecksumMismatch):
+        asyncio.run(run_with_server(server, fetch))
+    assert not os.path.exists(dest)
+    assert not os.path.exists(dest + ".part")
+
+
+def test_gives_up_after_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(download, "MAX_ATTEMPTS", 2)
+    server = FlakyServer()
+    dest = str(tmp_path / "AllPrintings.json.xz")
+
+    async def fetch(session, url):
+        return await download.download_resumable(session, f"{url}/data", dest, SHA256)
+
+    with pytest.raises(aiohttp.ClientPayloadError):
+        asyncio.run(run_with_server(server, fetch))
+    assert not os.path.exists(dest)
+    # kept so the next refresh resumes where this one stopped
+    assert os.path.getsize(dest + ".part") == 2 * CUT_EVERY
+
+
+def test_retries_server_errors(tmp_path):
+    server = FlakyServer(errors=[503, 502])
+    dest = str(tmp_path / "AllPrintings.json.xz")
+
+    async def fetch(session, url):
+        return await download.download_resumable(session, f"{url}/data", dest, SHA256)
+
+    asyncio.run(run_with_server(server, fetch))
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_client_errors_are_not_retried(tmp_path):
+    server = FlakyServer(errors=[404])
+    dest = str(tmp_path / "AllPrintings.json.xz")
+
+    async def fetch(session, url):
+        return await download.download_resumable(session, f"{url}/data", dest, SHA256)
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(run_with_server(server, fetch))
+    assert server.starts == []
+
+
+def test_reuses_verified_download(tmp_path):
+    server = FlakyServer()
+    dest = str(tmp_path / "AllPrintings.json.xz")
+    with open(dest, "wb") as f:
+        f.write(DATA)
+
+    async def fetch(session, url):
+        return await download.download_resumable(session, f"{url}/data", dest, SHA256)
+
+    assert asyncio.run(run_with_server(server, fetch)) == dest
+    assert server.starts == []
@@ -0,0 +1,183 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+
+import dropbox_client
+
+
+def file_entry(name):
+    return {
+        ".tag": "file",
+        "name": name,
+        "id": f"id:{name}",
+        "client_modified": "2020-01-01T00:00:00Z",
+        "server_modified": "2020-01-01T00:00:00Z",
+        "rev": "0123456789a",
+        "size": 3,
+        "path_lower": f"/mtg decks/{name.lower()}",
+        "path_display": f"/MTG Decks/{name}",
+        "is_downloadable": True,
+        "content_hash": "ab" * 32,
+    }
+
+
+class StubDropbox:
+    def __init__(self, expire_first_token=False, failures=None):
+        self.tokens_issued = 0
+        self.expire_first_token = expire_first_token
+        # path -> statuses to answer with before serving it normally
+        self.failures = failures or {}
+        self.requests = []
+
+    def failure(self, request):
+        statuses = self.failures.get(request.path)
+        if not statuses:
+            return None
+        status = statuses.pop(0)
+        return web.Response(status=status, headers={"Retry-After": "0"})
+
+    def authorized(self, request):
+        token = request.headers.get("Authorization")
+        if self.expire_first_token and token == "Bearer token-1":
+            return False
+        return token == f"Bearer token-{self.tokens_issued}"
+
+    async def token(self, request):
+        form = await request.post()
+        assert form["grant_type"] == "refresh_token"
+        assert form["refresh_token"] == "refresh"
+        self.tokens_issued += 1
+        return web.json_response(
+            {"access_token": f"token-{self.tokens_issued}", "expires_in": 14400}
+        )
+
+    async def list_folder(self, request):
+        self.requests.append(request.path)
+        if failure := self.failure(request):
+            return failure
+        if not self.authorized(request):
+            return web.Response(status=401)
+        assert (await request.json())["path"] == "/MTG Decks"
+        folder = dict(file_entry("folder"), **{".tag": "folder"})
+        return web.json_response(
+            {
+                "entries": [file_entry("a.txt"), folder],
+                "cursor": "cursor-1",
+                "has_more": True,
+            }
+        )
+
+    async def list_folder_continue(self, request):
+        self.requests.append(request.path)
+        if failure := self.failure(request):
+            return failure
+        if not self.authorized(request):
+            return web.Response(status=401)
+        assert (await request.json())["cursor"] == "cursor-1"
+        return web.json_response(
+            {"entries": [file_entry("b.cod")], "cursor": "cursor-2", "has_more": False}
+        )
+
+    async def download(self, request):
+        self.requests.append(request.path)
+        if failure := self.failure(request):
+            return failure
+        if not self.authorized(request):
+            return web.Response(status=401)
+        path = json.loads(request.headers["Dropbox-API-Arg"])["path"]
+        name = path.split("/")[-1]
+        return web.Response(
+            body=f"1 {name}\n".encode("utf-8") * 10000,
+            headers={"Dropbox-API-Result": json.dumps(file_entry(name))},
+        )
+
+
+async def run_with_stub(stub, test):
+    app = web.Application()
+    app.add_routes(
+        [
+            web.post("/oauth2/token", stub.token),
+            web.post("/2/files/list_folder", stub.list_folder),
+            web.post("/2/files/list_folder/continue", stub.list_folder_continue),
+            web.post("/2/files/download", stub.download),
+        ]
+    )
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f"http://{host}:{port}"
+    try:
+        async with dropbox_client.AsyncDropboxDeckClient(
+            "key", "secret", "refresh", api_url=url, content_url=url
+        ) as client:
+            return await test(client)
+    finally:
+        await runner.cleanup()
+
+
+def test_list_files_follows_cursor_and_skips_folders():
+    stub = StubDropbox()
+    files = asyncio.run(run_with_stub(stub, lambda client: client.list_files()))
+    assert [f.name for f in files] == ["a.txt", "b.cod"]
+    assert files[0].path_display == "/MTG Decks/a.txt"
+    assert stub.tokens_issued == 1
+
+
+def test_fetch_deck_streams_body_with_metadata():
+    stub = StubDropbox()
+
+    async def fetch_all(client):
+        files = await client.list_files()
+        return await asyncio.gather(*(client.fetch_deck(f) for f in files))
+
+    fetched = asyncio.run(run_with_stub(stub, fetch_all))
+    assert [metadata.name for metadata, _ in fetched] == ["a.txt", "b.cod"]
+    assert fetched[0][1] == b"1 a.txt\n" * 10000
+    # the token is shared by every concurrent request
+    assert stub.tokens_issued == 1
+
+
+def test_refreshes_token_after_401():
+    stub = StubDropbox(expire_first_token=True)
+
+    async def list_then_fetch(client):
+        files = await client.list_files()
+        return files, await client.fetch_deck(files[0])
+
+    files, (metadata, body) = asyncio.run(run_with_stub(stub, list_then_fetch))
+    assert [f.name for f in files] == ["a.txt", "b.cod"]
+    assert metadata.name == "a.txt"
+    assert stub.tokens_issued == 2
+    assert stub.requests[:2] == ["/2/files/list_folder", "/2/files/list_folder"]
+
+
+def test_retries_rate_limits_and_server_errors():
+    stub = StubDropbox(
+        failures={
+            "/2/files/list_folder": [429, 429],
+            "/2/files/download": [503],
+        }
+    )
+
+    async def list_then_fetch(client):
+        files = await client.list_files()
+        return files, await client.fetch_deck(files[0])
+
+    files, (metadata, body) = asyncio.run(run_with_stub(stub, list_then_fetch))
+    assert [f.name for f in files] == ["a.txt", "b.cod"]
+    assert metadata.name == "a.txt"
+    assert stub.requests.count("/2/files/list_folder") == 3
+    assert stub.requests.count("/2/files/download") == 2
+
+
+def test_gives_up_after_repeated_server_errors():
+    failures = [500] * (dropbox_client.MAX_RETRIES_ON_ERROR + 1)
+    stub = StubDropbox(failures={"/2/files/list_folder": failures})
+
+    with pytest.raises(dropbox_client.DropboxRetriesExhausted):
+        asyncio.run(run_with_stub(stub, lambda client: client.list_files()))
+    assert len(stub.requests) == dropbox_client.MAX_RETRIES_ON_ERROR + 1
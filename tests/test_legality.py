@@ -0,0 +1,47 @@
+import legality
+from deck_parser import parse_txt
+
+LEGAL_EVERYWHERE = {fmt: "Legal" for fmt in legality.FORMATS}
+
+
+def card(color_identity, **extra):
+    return dict(
+        {"colorIdentity": color_identity, "legalities": LEGAL_EVERYWHERE}, **extra
+    )
+
+
+TABLE = legality.LegalityTable(
+    [
+        ("Tymna the Weaver", card(["W", "B"])),
+        ("Thrasios, Triton Hero", card(["G", "U"])),
+        ("Swords to Plowshares", card(["W"])),
+        ("Brainstorm", card(["U"])),
+        ("Lightning Bolt", card(["R"])),
+        ("Island", card(["U"], supertypes=["Basic"])),
+    ]
+)
+COMMANDER_FORMATS = {"commander", "duel"}
+
+
+def legal(cards, commanders=()):
+    return set(legality.format_names(TABLE.deck_legality(cards, commanders)))
+
+
+def test_partner_commanders_pool_color_identity():
+    main, _, commanders = parse_txt(
+        b"Commander\n1 Tymna the Weaver\n1 Thrasios, Triton Hero\n"
+        b"Deck\n1 Swords to Plowshares\n1 Brainstorm\n10 Island\n"
+    )
+    assert commanders == ["Tymna the Weaver", "Thrasios, Triton Hero"]
+    assert COMMANDER_FORMATS <= legal(main, commanders)
+
+
+def test_card_outside_commander_identity():
+    cards = ["Tymna the Weaver", "Thrasios, Triton Hero", "Lightning Bolt"]
+    assert not COMMANDER_FORMATS & legal(cards, cards[:2])
+
+
+def test_copy_limits():
+    assert legal(["Brainstorm"] * 4) == {"legacy", "modern", "penny", "vintage"}
+    assert legal(["Brainstorm"] * 5) == set()
+    assert "modern" in legal(["Island"] * 40)
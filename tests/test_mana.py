@@ -0,0 +1,61 @@
+import numpy
+
+import mana
+
+
+def pips(mana_cost):
+    return {
+        column: count
+        for column, count in zip(mana.PIP_COLUMNS, mana.parse_mana_cost(mana_cost))
+        if count
+    }
+
+
+TABLE = mana.ManaTable(
+    [
+        ("Lightning Bolt", {"manaCost": "{R}", "manaValue": 1}),
+        ("Counterspell", {"manaCost": "{U}{U}", "convertedManaCost": 2}),
+        ("Emrakul, the Aeons Torn", {"manaCost": "{15}", "manaValue": 15}),
+        ("Mountain", {"types": ["Land"]}),
+        ("Dryad Arbor", {"types": ["Land", "Creature"], "manaValue": 0}),
+    ]
+)
+
+
+def test_parse_mana_cost():
+    assert pips("{2}{W}{W}") == {"W": 2, "generic": 2}
+    assert pips("{W/U}") == {"W": 1, "U": 1, "hybrid": 1}
+    # two-brid counts toward devotion but not generic
+    assert pips("{2/W}") == {"W": 1, "hybrid": 1}
+    assert pips("{W/P}") == {"W": 1, "phyrexian": 1}
+    assert pips("{X}{X}{R}") == {"X": 2, "R": 1}
+    assert pips("{C}{C}") == {"C": 2}
+    assert pips(None) == {}
+
+
+def test_deck_mana_devotion_and_curve():
+    deck = (
+        ["Lightning Bolt"] * 4
+        + ["Counterspell"] * 2
+        + ["Emrakul, the Aeons Torn"]
+        + ["Mountain"] * 20
+        + ["Dryad Arbor", "Not A Card"]
+    )
+    devotion, curve = TABLE.deck_mana(deck)
+    assert {
+        column: count for column, count in zip(mana.PIP_COLUMNS, devotion) if count
+    } == {"U": 4, "R": 4, "generic": 15}
+    # lands stay off the curve, everything from 7 up shares the last bucket
+    assert list(curve) == [0, 4, 2, 0, 0, 0, 0, 1]
+
+
+def test_deck_mana_empty_deck():
+    devotion, curve = TABLE.deck_mana([])
+    assert list(devotion) == [0] * len(mana.PIP_COLUMNS)
+    assert list(curve) == [0] * mana.MANA_VALUE_BUCKETS
+
+
+def test_sparkline():
+    assert mana.sparkline(numpy.array([0, 4, 2, 0, 0, 0, 0, 1])) == " █▅    ▃"
+    assert mana.sparkline(numpy.zeros(mana.MANA_VALUE_BUCKETS)) == " " * 8
+    assert mana.sparkline(numpy.array([])) == ""
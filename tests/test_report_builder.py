@@ -0,0 +1,107 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+import report_builder
+
+CARDS = {
+    "Lightning Bolt": {"manaCost": "{R}", "manaValue": 1, "colorIdentity": ["R"]},
+    "Counterspell": {"manaCost": "{U}{U}", "manaValue": 2, "colorIdentity": ["U"]},
+    "Island": {"types": ["Land"], "supertypes": ["Basic"], "colorIdentity": ["U"]},
+}
+DECKS = {
+    "aggro/burn.txt": "4 Lightning Bolt\n",
+    "aggro/zoo.txt": "4 Lightning Bolt\n",
+    "control/draw-go.txt": "4 Counterspell\n20 Island\n",
+}
+
+
+@pytest.fixture
+def deck_root(tmp_path, monkeypatch):
+    # main() chdirs into the deck root, monkeypatch puts the cwd back
+    monkeypatch.chdir(tmp_path)
+    card_json = tmp_path / "cards.json"
+    card_json.write_text(
+        json.dumps(
+            {
+                "data": {
+                    name: [
+                        dict(
+                            {"types": ["Instant"], "legalities": {"legacy": "Legal"}},
+                            **card,
+                        )
+                    ]
+                    for name, card in CARDS.items()
+                }
+            }
+        )
+    )
+    root = tmp_path / "decks"
+    for path, contents in DECKS.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(contents)
+    return root, card_json, tmp_path / "out"
+
+
+def build(deck_root, *options):
+    root, card_json, out = deck_root
+    out.mkdir()
+    result = CliRunner().invoke(
+        report_builder.main,
+        [str(root), str(card_json), str(out / "report.html"), *options],
+    )
+    assert result.exit_code == 0, result.output
+    with open(out / "report-index.js") as f:
+        index_js = f.read()
+    prefix, suffix = "const DECK_INDEX = ", ";\n"
+    assert index_js.startswith(prefix) and index_js.endswith(suffix)
+    return out, json.loads(index_js[len(prefix) : -len(suffix)])
+
+
+def page_deck_paths(page):
+    return {path for path in DECKS if f'<tr id="{path}">' in page.read_text()}
+
+
+def test_shard_by_folder(deck_root):
+    out, index = build(deck_root, "--shard-by", "folder")
+    assert index["pages"] == [["aggro", "report-0.html"], ["control", "report-1.html"]]
+    assert sorted(p.name for p in out.glob("report-*.html")) == [
+        "report-0.html",
+        "report-1.html",
+    ]
+    assert page_deck_paths(out / "report-0.html") == {
+        "aggro/burn.txt",
+        "aggro/zoo.txt",
+    }
+    assert page_deck_paths(out / "report-1.html") == {"control/draw-go.txt"}
+    assert [row[:5] for row in index["decks"]] == [
+        ["burn.txt", "aggro/burn.txt", 0, 4, 0],
+        ["zoo.txt", "aggro/zoo.txt", 0, 4, 0],
+        ["draw-go.txt", "control/draw-go.txt", 1, 24, 0],
+    ]
+    assert index["decks"][2][6] == "U"
+    assert "report-index.js" in (out / "report.html").read_text()
+
+
+def test_shard_by_size(deck_root):
+    out, index = build(deck_root, "--shard-by", "size", "--shard-size", "2")
+    assert index["pages"] == [
+        ["burn.txt - zoo.txt", "report-0.html"],
+        ["draw-go.txt - draw-go.txt", "report-1.html"],
+    ]
+    assert page_deck_paths(out / "report-0.html") == {
+        "aggro/burn.txt",
+        "aggro/zoo.txt",
+    }
+    assert page_deck_paths(out / "report-1.html") == {"control/draw-go.txt"}
+    assert [row[2] for row in index["decks"]] == [0, 0, 1]
+
+
+def test_shard_size_must_be_positive(deck_root):
+    root, card_json, out = deck_root
+    result = CliRunner().invoke(
+        report_builder.main,
+        [str(root), str(card_json), str(out / "report.html"), "--shard-size", "0"],
+    )
+    assert result.exit_code == 2
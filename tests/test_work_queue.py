@@ -0,0 +1,81 @@
+import time
+
+import fakeredis
+import pytest
+
+from work_queue import WorkQueue
+
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis()
+
+
+def test_enqueue_claim_ack(r):
+    queue = WorkQueue(r, "test")
+    assert queue.enqueue("a", {"path": "/a.txt"})
+    assert queue.enqueue("b", {"path": "/b.txt"})
+    assert len(queue) == 2
+
+    assert queue.claim() == ("a", {"path": "/a.txt"})
+    assert queue.claim() == ("b", {"path": "/b.txt"})
+    assert queue.claim() is None
+
+    assert queue.ack("a")
+    assert queue.ack("b")
+    assert len(queue) == 0
+    assert not queue.ack("a")
+
+
+def test_enqueue_same_job_is_noop(r):
+    queue = WorkQueue(r, "test")
+    assert queue.enqueue("a", {"path": "/a.txt"})
+    assert not queue.enqueue("a", {"path": "/a.txt"})
+    assert queue.claim() == ("a", {"path": "/a.txt"})
+    assert queue.claim() is None
+
+
+def test_enqueue_replaces_changed_payload(r):
+    queue = WorkQueue(r, "test", visibility_timeout_sec=0)
+    queue.enqueue("a", {"path": "/old.txt"})
+    assert queue.claim() == ("a", {"path": "/old.txt"})
+    # moved while leased, the retry picks up the new path
+    assert not queue.enqueue("a", {"path": "/new.txt"})
+    time.sleep(0.01)
+    assert queue.claim() == ("a", {"path": "/new.txt"})
+
+
+def test_expired_lease_is_requeued(r):
+    queue = WorkQueue(r, "test", visibility_timeout_sec=0)
+    queue.enqueue("a", {})
+    assert queue.claim() == ("a", {})
+    time.sleep(0.01)
+    assert queue.claim() == ("a", {})
+
+
+def test_ack_after_requeue_drops_job(r):
+    queue = WorkQueue(r, "test", visibility_timeout_sec=0)
+    queue.enqueue("a", {})
+    queue.claim()
+    time.sleep(0.01)
+    queue.claim()
+    assert queue.ack("a")
+    time.sleep(0.01)
+    assert queue.claim() is None
+
+
+def test_dead_letter_after_max_attempts(r):
+    queue = WorkQueue(r, "test", visibility_timeout_sec=0, max_attempts=2)
+    queue.enqueue("a", {"path": "/gone.txt"})
+    for _ in range(2):
+        assert queue.claim() == ("a", {"path": "/gone.txt"})
+        time.sleep(0.01)
+    assert queue.claim() is None
+    assert queue.dead_letters() == {"a": {"path": "/gone.txt"}}
+    assert len(queue) == 0
+
+    # the same job is not retried, a changed one is
+    assert not queue.enqueue("a", {"path": "/gone.txt"})
+    assert queue.enqueue("a", {"path": "/found.txt"})
+    assert queue.dead_letters() == {}
+    assert queue.claim() == ("a", {"path": "/found.txt"})